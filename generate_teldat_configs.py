@@ -1,385 +1,3040 @@
+import argparse
+import contextlib
 import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import os
 import re
 import ipaddress
+import struct
 import sys
-sys.stdout.reconfigure(encoding='utf-8')
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Generator version: bump when the rendered output changes ---
+GENERATOR_VERSION = "1.1.0"
 
 # --- Default DHCP range behavior ---
 DEFAULT_RESERVE_COUNT = 2  # Reserve last 2 usable IPs (range ends 2 before router)
+NETWORK_INFO_CACHE_SIZE = 8192  # compute_network_info LRU entries
+COMPILED_TEMPLATE_CACHE_SIZE = 16  # compile_template LRU entries (distinct templates)
+
+# --- Output folder and parallel rendering defaults ---
+OUTPUT_DIR = "output_configs"
+MANIFEST_FILE = ".teldat_manifest.json"  # Incremental-run manifest, stored next to the outputs
+SHARD_MANIFEST_FILE = ".teldat_shard.json"  # Shard manifest of a sharded run writing to a folder
+ROW_INDEX_SUFFIX = ".teldat_index"  # Row index of an inventory CSV, stored next to it (<csv>.teldat_index)
+ZIP_SPOOL_MAX_SIZE = 64 * 1024 * 1024  # ZipSink spools to disk beyond this size (when spooling)
+DEFAULT_TOP_N = 10  # Slowest stores listed in the timing report
+DEFAULT_CHUNK_SIZE = 200  # Rows sent to a worker process at a time
+DELTA_FORMAT = "teldat-config-delta"  # Delta archive marker (DeltaSink / DeltaArchive)
+DELTA_FORMAT_VERSION = 1
+DELTA_COMPRESS_LEVEL = 6  # gzip level: 9 is ~5x slower for ~3% smaller archives
+
+# --- VLAN mask mapping (for InterVlan only): the built-in "default" VLAN profile ---
+DEFAULT_VLAN_PROFILE_NAME = "default"
+VLAN_MASK_MAP = {
+    "3100": "255.255.255.240",  # /28
+    "3137": "255.255.255.240",
+    "3138": "255.255.255.224",  # /27
+    "3139": "255.255.255.224",
+    "3140": "255.255.255.224",
+    "3141": "255.255.255.128",  # /25
+}
+
 
 # --- Auto-detect template and CSV filenames ---
-template_file = None
-csv_file = None
-priority_csv = None
-
-for f in os.listdir("."):
-    # Detect template file
-    if "teldat" in f.lower() and "template" in f.lower():
-        template_file = f
-    elif ("flat_vlan" in f.lower() or "inter_vlan" in f.lower()) and "template" in f.lower():
-        template_file = f
-    # Detect CSV with priority naming
-    elif f.lower().endswith(".csv"):
-        if "flatvlan" in f.lower() or "intervlan" in f.lower() or "flat_vlan" in f.lower() or "inter_vlan" in f.lower():
-            priority_csv = f  # Priority: flatvlan_sites.csv or intervlan_sites.csv
-        elif csv_file is None:
-            csv_file = f  # Fallback to any CSV
-
-# Use priority CSV if found, otherwise fallback
-csv_file = priority_csv if priority_csv else csv_file
-
-if not template_file:
-    raise FileNotFoundError("❌ Could not find Teldat template file (should contain 'template' in the name).")
-if not csv_file:
-    raise FileNotFoundError("❌ Could not find CSV file (should end with .csv, preferably 'flatvlan_sites.csv' or 'intervlan_sites.csv').")
-
-print(f"✅ Using template: {template_file}")
-print(f"✅ Using CSV: {csv_file}")
+def find_input_files(directory="."):
+    """Return (template_file, csv_file) found by name in `directory`."""
+    template_file = None
+    csv_file = None
+    priority_csv = None
+
+    for f in os.listdir(directory):
+        # Detect template file
+        if "teldat" in f.lower() and "template" in f.lower():
+            template_file = f
+        elif ("flat_vlan" in f.lower() or "inter_vlan" in f.lower()) and "template" in f.lower():
+            template_file = f
+        # Detect CSV with priority naming
+        elif f.lower().endswith(".csv"):
+            if "flatvlan" in f.lower() or "intervlan" in f.lower() or "flat_vlan" in f.lower() or "inter_vlan" in f.lower():
+                priority_csv = f  # Priority: flatvlan_sites.csv or intervlan_sites.csv
+            elif csv_file is None:
+                csv_file = f  # Fallback to any CSV
+
+    # Use priority CSV if found, otherwise fallback
+    csv_file = priority_csv if priority_csv else csv_file
+
+    if not template_file:
+        raise FileNotFoundError("❌ Could not find Teldat template file (should contain 'template' in the name).")
+    if not csv_file:
+        raise FileNotFoundError("❌ Could not find CSV file (should end with .csv, preferably 'flatvlan_sites.csv' or 'intervlan_sites.csv').")
+
+    return template_file, csv_file
+
 
 # --- Detect template type ---
-with open(template_file, "r", encoding="utf-8") as f:
-    template_content = f.read()
-
-# Detect from filename - TEMPLATE NAME TAKES PRIORITY
-is_flat_vlan = False
-detection_method = ""
-
-# Priority 1: Template filename (HIGHEST PRIORITY)
-template_upper = template_file.upper()
-if "FLAT_VLAN" in template_upper or "FLAT VLAN" in template_upper or "FLATVLAN" in template_upper:
-    is_flat_vlan = True
-    detection_method = f"Template name '{template_file}' contains 'FLAT_VLAN'"
-elif "INTER_VLAN" in template_upper or "INTER VLAN" in template_upper or "INTERVLAN" in template_upper:
+def detect_template_type(template_file, csv_file, template_content):
+    """Return (is_flat_vlan, detection_method) for a template / CSV pair."""
+    # Detect from filename - TEMPLATE NAME TAKES PRIORITY
     is_flat_vlan = False
-    detection_method = f"Template name '{template_file}' contains 'INTER_VLAN'"
-# Check for generic TELDAT templates - use CSV
-elif "TELDAT" in template_upper and "TEMPLATE" in template_upper:
-    # Fallback to CSV naming for generic TELDAT templates
-    csv_lower = csv_file.lower()
-    if "flatvlan" in csv_lower or "flat_vlan" in csv_lower:
+    detection_method = ""
+
+    # Priority 1: Template filename (HIGHEST PRIORITY)
+    template_upper = template_file.upper()
+    if "FLAT_VLAN" in template_upper or "FLAT VLAN" in template_upper or "FLATVLAN" in template_upper:
         is_flat_vlan = True
-        detection_method = f"Template is generic TELDAT, CSV name '{csv_file}' suggests FlatVlan"
-    elif "intervlan" in csv_lower or "inter_vlan" in csv_lower:
+        detection_method = f"Template name '{template_file}' contains 'FLAT_VLAN'"
+    elif "INTER_VLAN" in template_upper or "INTER VLAN" in template_upper or "INTERVLAN" in template_upper:
         is_flat_vlan = False
-        detection_method = f"Template is generic TELDAT, CSV name '{csv_file}' suggests InterVlan"
+        detection_method = f"Template name '{template_file}' contains 'INTER_VLAN'"
+    # Check for generic TELDAT templates - use CSV
+    elif "TELDAT" in template_upper and "TEMPLATE" in template_upper:
+        # Fallback to CSV naming for generic TELDAT templates
+        csv_lower = csv_file.lower()
+        if "flatvlan" in csv_lower or "flat_vlan" in csv_lower:
+            is_flat_vlan = True
+            detection_method = f"Template is generic TELDAT, CSV name '{csv_file}' suggests FlatVlan"
+        elif "intervlan" in csv_lower or "inter_vlan" in csv_lower:
+            is_flat_vlan = False
+            detection_method = f"Template is generic TELDAT, CSV name '{csv_file}' suggests InterVlan"
+        else:
+            # Last resort: check template content
+            has_vlan_subinterfaces = bool(re.search(r'network bvi0\.\d+', template_content))
+            has_single_bvi = re.search(r'network bvi0\s', template_content) and not has_vlan_subinterfaces
+            is_flat_vlan = has_single_bvi
+            detection_method = f"Template content analysis (single BVI: {has_single_bvi})"
+    # Priority 2: CSV filename only
+    elif "flatvlan" in csv_file.lower() or "flat_vlan" in csv_file.lower():
+        is_flat_vlan = True
+        detection_method = f"CSV name '{csv_file}' contains 'flatvlan'"
+    elif "intervlan" in csv_file.lower() or "inter_vlan" in csv_file.lower():
+        is_flat_vlan = False
+        detection_method = f"CSV name '{csv_file}' contains 'intervlan'"
+    # Priority 3: Template content (fallback)
     else:
-        # Last resort: check template content
         has_vlan_subinterfaces = bool(re.search(r'network bvi0\.\d+', template_content))
         has_single_bvi = re.search(r'network bvi0\s', template_content) and not has_vlan_subinterfaces
         is_flat_vlan = has_single_bvi
-        detection_method = f"Template content analysis (single BVI: {has_single_bvi})"
-# Priority 2: CSV filename only
-elif "flatvlan" in csv_file.lower() or "flat_vlan" in csv_file.lower():
-    is_flat_vlan = True
-    detection_method = f"CSV name '{csv_file}' contains 'flatvlan'"
-elif "intervlan" in csv_file.lower() or "inter_vlan" in csv_file.lower():
-    is_flat_vlan = False
-    detection_method = f"CSV name '{csv_file}' contains 'intervlan'"
-# Priority 3: Template content (fallback)
-else:
-    has_vlan_subinterfaces = bool(re.search(r'network bvi0\.\d+', template_content))
-    has_single_bvi = re.search(r'network bvi0\s', template_content) and not has_vlan_subinterfaces
-    is_flat_vlan = has_single_bvi
-    detection_method = f"Template content check (single BVI: {has_single_bvi}, VLAN subinterfaces: {has_vlan_subinterfaces})"
-
-template_type = "FlatVlan" if is_flat_vlan else "InterVlan"
-print(f"🔍 Detection: {detection_method}")
-print(f"📋 Template type: {template_type}")
-
-# Validate CSV naming matches template type
-csv_lower = csv_file.lower()
-if is_flat_vlan and ("intervlan" in csv_lower or "inter_vlan" in csv_lower):
-    print(f"⚠️  WARNING: Using FlatVlan template but CSV name suggests InterVlan: {csv_file}")
-elif not is_flat_vlan and ("flatvlan" in csv_lower or "flat_vlan" in csv_lower):
-    print(f"⚠️  WARNING: Using InterVlan template but CSV name suggests FlatVlan: {csv_file}")
-
-print()  # Empty line for readability
-
-# --- Ensure output folder exists ---
-OUTPUT_DIR = "output_configs"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+        detection_method = f"Template content check (single BVI: {has_single_bvi}, VLAN subinterfaces: {has_vlan_subinterfaces})"
 
-# --- Load the template ---
-template = template_content
+    return bool(is_flat_vlan), detection_method
 
-# --- VLAN mask mapping (for InterVlan only) ---
-VLAN_MASK_MAP = {
-    "3100": "255.255.255.240",  # /28
-    "3137": "255.255.255.240",
-    "3138": "255.255.255.224",  # /27
-    "3139": "255.255.255.224",
-    "3140": "255.255.255.224",
-    "3141": "255.255.255.128",  # /25
-}
+
+# --- Logging ---
+LOG_QUIET, LOG_SUMMARY, LOG_VERBOSE = 0, 1, 2
+
+
+def message_severity(message):
+    """Classify a log message by its emoji prefix: "error", "warning" or None."""
+    text = message.lstrip()
+    if text.startswith("❌"):
+        return "error"
+    if text.startswith("⚠️"):
+        return "warning"
+    return None
+
+
+class GenerationLog:
+    """Callable log with levels, warning/error counts and a JSON-lines event log.
+
+    Calling the log records a detail message, shown only at LOG_VERBOSE.
+    info() messages are shown from LOG_SUMMARY up. Messages starting with
+    ❌ / ⚠️ are counted as errors / warnings and shown at every level.
+    `events` is an optional text file that receives one JSON record per
+    store, per warning outside a store, and a final summary.
+    """
+
+    def __init__(self, level=LOG_VERBOSE, write=print, events=None):
+        self.level = level
+        self.write = write
+        self.events = events
+        self.stores = 0
+        self.warnings = 0
+        self.errors = 0
+        self.problems = []  # Warning and error messages, with the store they belong to
+
+    @property
+    def verbose(self):
+        return self.level >= LOG_VERBOSE
+
+    def __call__(self, message):
+        self._log(message, LOG_VERBOSE)
+
+    def info(self, message):
+        self._log(message, LOG_SUMMARY)
+
+    def _log(self, message, level, store=None):
+        severity = message_severity(message)
+        if severity is None:
+            if self.level >= level:
+                self.write(message)
+            return None
+
+        if severity == "error":
+            self.errors += 1
+        else:
+            self.warnings += 1
+        text = message.strip()
+        self.problems.append(f"[{store}] {text}" if store else text)
+        # Outside verbose output the store context is lost, so prefix it
+        self.write(message if self.verbose or not store else f"   [{store}] {text}")
+        if store is None:
+            self._event({"event": severity, "message": text})
+        return severity
+
+    def store(self, store, filename, lines):
+        """Log one rendered store's messages and record its event."""
+        record = {"event": "store", "store": store, "file": filename, "warnings": [], "errors": []}
+        for line in lines:
+            severity = self._log(line, LOG_VERBOSE, store)
+            if severity:
+                record[severity + "s"].append(line.strip())
+        self.stores += 1
+        self._event(record)
+
+    def summary(self):
+        self._event({"event": "summary", "stores": self.stores, "warnings": self.warnings, "errors": self.errors})
+        return f"📊 Summary: {self.stores} store(s), {self.warnings} warning(s), {self.errors} error(s)"
+
+    def _event(self, record):
+        if self.events is not None:
+            self.events.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# --- Instrumentation ---
+class Instrumentation:
+    """Per-phase timers, counters and the slowest stores of one run.
+
+    Phases: detect, compile, csv_read, network_info, render, write, and
+    regex:<kind> for each substitution kind when the regex chain is used.
+    Times measured in worker processes are merged in (summed across workers).
+    """
+
+    enabled = True
+
+    def __init__(self, top_n=DEFAULT_TOP_N):
+        self.top_n = top_n
+        self.started = time.perf_counter()
+        self.phases = {}  # name -> [seconds, calls]
+        self.counters = {}
+        self._slowest = []  # min-heap of (seconds, store)
+        self._cache_start = _mask_bits.cache_info()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds, calls=1):
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def store(self, store, seconds):
+        item = (seconds, store)
+        if len(self._slowest) < self.top_n:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def timed(self, name, iterable):
+        """Yield from `iterable`, adding the time of each step to phase `name`."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def cache_counters(self):
+        """Mask cache (_mask_bits) hits/misses since this object was created.
+
+        Every IPv4 DHCP range goes through it; compute_network_info is only
+        left for IPv6 LANs, so its cache is not reported.
+        """
+        info = _mask_bits.cache_info()
+        return {
+            "mask_cache_hits": info.hits - self._cache_start.hits,
+            "mask_cache_misses": info.misses - self._cache_start.misses,
+        }
+
+    def to_dict(self):
+        """Raw measurements, as sent back by worker processes for merge()."""
+        counters = dict(self.counters)
+        for name, amount in self.cache_counters().items():
+            counters[name] = counters.get(name, 0) + amount
+        return {"phases": self.phases, "counters": counters, "slowest": self._slowest}
+
+    def merge(self, data):
+        for name, (seconds, calls) in data["phases"].items():
+            self.add(name, seconds, calls)
+        for name, amount in data["counters"].items():
+            self.count(name, amount)
+        for seconds, store in data["slowest"]:
+            self.store(store, seconds)
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        data = self.to_dict()
+        return {
+            "total_seconds": round(total, 4),
+            "phases": {
+                name: {"seconds": round(seconds, 4), "calls": calls,
+                       "share": round(seconds / total, 4) if total else None}
+                for name, (seconds, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0])
+            },
+            "counters": dict(sorted(data["counters"].items())),
+            "slowest_stores": [{"store": store, "ms": round(seconds * 1000, 3)}
+                               for seconds, store in sorted(self._slowest, reverse=True)],
+        }
+
+    def format_report(self):
+        report = self.report()
+        lines = [f"⏱️  Timing report (total {report['total_seconds']:.3f}s)",
+                 f"   {'phase':<22}{'seconds':>10}{'calls':>10}{'share':>8}"]
+        for name, phase in report["phases"].items():
+            share = f"{phase['share']:.0%}" if phase["share"] is not None else "-"
+            lines.append(f"   {name:<22}{phase['seconds']:>10.4f}{phase['calls']:>10}{share:>8}")
+        if report["counters"]:
+            lines.append("   Counters: " + ", ".join(f"{name}={amount}" for name, amount in report["counters"].items()))
+        if report["slowest_stores"]:
+            lines.append(f"   🐢 Slowest stores:")
+            lines += [f"      {entry['store']}: {entry['ms']} ms" for entry in report["slowest_stores"]]
+        return "\n".join(lines)
+
+
+class _NoInstrumentation:
+    """Stand-in used when instrumentation is off; every hook is a no-op."""
+
+    enabled = False
+
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+    def add(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def store(self, store, seconds):
+        pass
+
+    def timed(self, name, iterable):
+        return iterable
+
+    def merge(self, data):
+        pass
+
+
+NO_INSTRUMENTATION = _NoInstrumentation()
+
+
+def run_profiled(kind, func, output=None):
+    """Run func() under cProfile or tracemalloc and report to stdout or `output`."""
+    if kind == "cprofile":
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.runcall(func)
+        if output:
+            profiler.dump_stats(output)
+            print(f"🔬 cProfile stats written to {output}")
+        else:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    elif kind == "tracemalloc":
+        import tracemalloc
+
+        tracemalloc.start()
+        func()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = [f"🔬 tracemalloc: current {current / 1024 / 1024:.1f} MB, peak {peak / 1024 / 1024:.1f} MB"]
+        lines += [f"   {stat}" for stat in snapshot.statistics("lineno")[:15]]
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            print(f"🔬 tracemalloc report written to {output}")
+        else:
+            print("\n".join(lines))
+    else:
+        raise ValueError(f"❌ Unknown profiler '{kind}' (expected 'cprofile' or 'tracemalloc').")
 
 
 # --- Helper: compute network info ---
+@functools.lru_cache(maxsize=NETWORK_INFO_CACHE_SIZE)
 def compute_network_info(vlan_ip, mask, reserve_count=DEFAULT_RESERVE_COUNT):
+    """Return (network, DHCP range start, DHCP range end) for an IP and mask.
+
+    Same result as scanning list(network.hosts()), computed with integer
+    arithmetic so it is O(1) for any prefix length.
+    """
     network = ipaddress.ip_network(f"{vlan_ip}/{mask}", strict=False)
-    hosts = list(network.hosts())
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
 
-    # Default start = first usable
-    if len(hosts) == 0:
-        range_start = vlan_ip
-        range_end = vlan_ip
-    else:
-        range_start = str(hosts[0])
-        # end = last usable - reserve_count
-        end_index = len(hosts) - 1 - reserve_count
-        if end_index < 0:
-            end_index = 0
-        range_end = str(hosts[end_index])
+    # /31 point-to-point and /32 host networks: every address is usable.
+    # Otherwise skip the network address (and the IPv4 broadcast address).
+    if network.prefixlen < network.max_prefixlen - 1:
+        first += 1
+        if network.version == 4:
+            last -= 1
+
+    # Default start = first usable, end = last usable - reserve_count
+    address_class = type(network.network_address)
+    range_start = str(address_class(first))
+    range_end = str(address_class(max(first, last - reserve_count)))
 
     network_addr = str(network.network_address)
     return network_addr, range_start, range_end
 
 
-# --- Process each store in CSV ---
-with open(csv_file, newline='', encoding="utf-8") as csvfile:
-    # Read all content
-    content = csvfile.read()
-    lines = content.strip().split('\n')
-    
-    if not lines:
-        raise ValueError("❌ CSV file is empty")
-    
-    # Detect delimiter from first line
-    first_line = lines[0]
-    
+@functools.lru_cache(maxsize=None)
+def _mask_bits(mask):
+    """Return (prefix length, host mask as int) of an IPv4 dotted mask."""
+    network = ipaddress.IPv4Network(f"0.0.0.0/{mask}")
+    return network.prefixlen, int(network.hostmask)
+
+
+def _ipv4_int(text):
+    """Return a dotted-quad IPv4 address as an int, or None if `text` is not one."""
+    parts = text.split(".")
+    if len(parts) == 4 and "" not in parts and text.isascii() and text.replace(".", "").isdigit():
+        a, b, c, d = map(int, parts)
+        # Round-trip rejects empty octets and leading zeros, as ipaddress does
+        if max(a, b, c, d) < 256 and f"{a}.{b}.{c}.{d}" == text:
+            return (a << 24) | (b << 16) | (c << 8) | d
+    return None
+
+
+def _format_ipv4(value):
+    return f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def site_network_info(ip, ip_int, mask, reserve_count=DEFAULT_RESERVE_COUNT):
+    """compute_network_info for an address already parsed to `ip_int`.
+
+    IPv4 is pure integer arithmetic; ip_int=None (IPv6) goes through
+    compute_network_info.
+    """
+    if ip_int is None:
+        return compute_network_info(ip, mask, reserve_count)
+    prefix, hostmask = _mask_bits(mask)
+    network = ip_int & ~hostmask
+    first, last = network, network | hostmask
+    if prefix < 31:
+        first += 1
+        last -= 1
+    return _format_ipv4(network), _format_ipv4(first), _format_ipv4(max(first, last - reserve_count))
+
+
+# --- Helper: stream CSV rows ---
+WHITESPACE_SPLIT_PATTERN = re.compile(r'\s{2,}|\t+')
+
+
+def detect_delimiter(first_line):
+    """Return (delimiter, display name); None means multiple-space separated."""
     if ',' in first_line and first_line.count(',') > 5:
-        delimiter = ','
-        delimiter_name = "Comma"
-    elif '\t' in first_line and first_line.count('\t') > 5:
-        delimiter = '\t'
-        delimiter_name = "Tab"
-    else:
-        # Multiple spaces - need special handling
-        delimiter = None
-        delimiter_name = "Whitespace (multiple spaces)"
-    
-    print(f"📊 CSV Delimiter detected: {delimiter_name}\n")
-    
-    if delimiter:
-        # Standard CSV parsing
-        import io
-        csv_io = io.StringIO(content)
-        reader = csv.DictReader(csv_io, delimiter=delimiter)
-        rows = list(reader)
-    else:
+        return ',', "Comma"
+    if '\t' in first_line and first_line.count('\t') > 5:
+        return '\t', "Tab"
+    # Multiple spaces - need special handling
+    return None, "Whitespace (multiple spaces)"
+
+
+@contextlib.contextmanager
+def open_csv_source(csv_source):
+    """Open a CSV path, raw bytes or file object as a text stream.
+
+    File objects passed in by the caller are left open.
+    """
+    if isinstance(csv_source, (str, os.PathLike)):
+        with open(csv_source, newline='', encoding="utf-8") as csvfile:
+            yield csvfile
+        return
+    if isinstance(csv_source, (bytes, bytearray)):
+        csv_source = io.BytesIO(csv_source)
+    if isinstance(csv_source, io.TextIOBase):
+        yield csv_source
+        return
+    csvfile = io.TextIOWrapper(csv_source, encoding="utf-8", newline='')
+    try:
+        yield csvfile
+    finally:
+        csvfile.detach()
+
+
+def iter_csv_values(csv_source, log=print, timer=None):
+    """Yield the CSV header (a list), then (line number, values) for every row.
+
+    `csv_source` is a path, the CSV bytes or a file object. Only the header
+    line is inspected to detect the delimiter, so memory stays flat
+    regardless of the number of rows in the inventory. The stream is never
+    rewound, so pipes and other non-seekable file objects work too.
+    Messages (delimiter, skipped rows) are passed to `log` in file order.
+    """
+    timer = timer or NO_INSTRUMENTATION
+    with open_csv_source(csv_source) as csvfile:
+        # Detect delimiter from first non-empty line
+        first_line = ""
+        header_line = 0
+        for line in csvfile:
+            header_line += 1
+            if line.strip():
+                first_line = line.strip()
+                break
+
+        delimiter, delimiter_name = detect_delimiter(first_line)
+        log(f"📊 CSV Delimiter detected: {delimiter_name}\n")
+
+        if delimiter:
+            # Standard CSV parsing (blank rows skipped, as csv.DictReader does),
+            # starting again from the header line already read
+            reader = csv.reader(itertools.chain([line], csvfile), delimiter=delimiter)
+            yield next(reader, [])
+            for values in reader:
+                if values:
+                    yield reader.line_num + header_line - 1, values
+            return
+
         # Handle whitespace-separated with multiple spaces
         # Split by multiple spaces/tabs
-        headers = re.split(r'\s{2,}|\t+', lines[0].strip())
-        
+        timer.count("regex_calls")
+
         # Clean headers
-        headers = [h.strip() for h in headers if h.strip()]
-        
-        print(f"📋 Detected columns: {', '.join(headers)}\n")
-        
-        rows = []
-        for line in lines[1:]:
+        headers = _whitespace_values(first_line)
+
+        log(f"📋 Detected columns: {', '.join(headers)}\n")
+        yield headers
+
+        # Continue after the header line
+        for number, line in enumerate(csvfile, header_line + 1):
             if not line.strip():
                 continue
-            # Split by multiple spaces/tabs
-            values = re.split(r'\s{2,}|\t+', line.strip())
-            values = [v.strip() for v in values if v.strip()]
-            
+            values = _whitespace_values(line)
+            timer.count("regex_calls")
+
             if len(values) == len(headers):
-                rows.append(dict(zip(headers, values)))
+                yield number, values
             else:
-                print(f"⚠️  Skipping malformed row (expected {len(headers)} columns, got {len(values)}): {line[:50]}...")
-    
-    for row in rows:
-        store_key = next((k for k in row.keys() if "store" in k.lower()), None)
-        if not store_key:
+                line = line.rstrip('\n')
+                log(f"⚠️  Skipping malformed row (expected {len(headers)} columns, got {len(values)}): {line[:50]}...")
+
+
+def _whitespace_values(line):
+    # Split by multiple spaces/tabs
+    return [v.strip() for v in WHITESPACE_SPLIT_PATTERN.split(line.strip()) if v.strip()]
+
+
+def iter_csv_rows(csv_source, log=print, timer=None):
+    """Yield the CSV rows as dicts, one at a time (see iter_csv_values).
+
+    Rows shorter than the header get None values and longer ones keep the
+    extra values under the None key, as with csv.DictReader.
+    """
+    rows = iter_csv_values(csv_source, log, timer)
+    header = next(rows)
+    for _, values in rows:
+        yield _row_dict(header, values)
+
+
+def _row_dict(header, values):
+    row = dict(zip(header, values))
+    if len(values) > len(header):
+        row[None] = values[len(header):]
+    else:
+        for key in header[len(values):]:
+            row[key] = None
+    return row
+
+
+# --- Site records: typed rows, columns resolved once per file ---
+DEFAULT_LAN_MASK = "255.255.255.192"  # FlatVlan LAN mask when the CSV has no mask column
+VLAN_COLUMN_PATTERN = re.compile(r"VLAN\d+")  # VLAN address columns (VLAN3100, ...), not e.g. VLAN_Notes
+
+
+class SiteColumns:
+    """Positions of the columns the generator reads, resolved once per CSV header.
+
+    Names match exactly, as render_store always matched them; a repeated
+    column name takes its last value, as with csv.DictReader.
+    """
+
+    def __init__(self, header):
+        self.header = header
+        index = {key: position for position, key in enumerate(header) if isinstance(key, str)}
+        self.store_key = next((key for key in index if "store" in key.lower()), None)
+        self.store = index.get(self.store_key)
+        self.tnip1 = index.get("Tnip1")
+        self.tnip2 = index.get("Tnip2")
+        self.bvi_ip = index.get("BVI_IP")
+        self.bvi_mask_key = "Branch_Mask" if "Branch_Mask" in index else "BVI_Mask"
+        self.bvi_mask = index.get(self.bvi_mask_key)
+        self.lan_ip = index.get("LAN_IP")
+        self.lan_mask = index.get("LAN_Mask")
+        self.vlans = [(key, position) for key, position in index.items() if VLAN_COLUMN_PATTERN.fullmatch(key)]
+        self.vrf_ip = index.get("VRF_Branch_IP")
+        self.vrf_mask = index.get("VRF_Branch_Mask")
+        self.template = index.get(TEMPLATE_COLUMN)
+
+    @staticmethod
+    def field(values, position):
+        """The stripped value at `position`; "" for a missing column or short row."""
+        if position is None or position >= len(values) or values[position] is None:
+            return ""
+        return values[position].strip()
+
+    def lan(self, values):
+        """Return the FlatVlan (ip column, ip, mask column, mask) of a row, or None.
+
+        BVI_IP (with Branch_Mask or BVI_Mask) wins over LAN_IP (with LAN_Mask);
+        without a mask column the mask is DEFAULT_LAN_MASK.
+        """
+        if self.field(values, self.bvi_ip):
+            name, ip_position, mask_name, mask_position = "BVI_IP", self.bvi_ip, self.bvi_mask_key, self.bvi_mask
+        elif self.field(values, self.lan_ip):
+            name, ip_position, mask_name, mask_position = "LAN_IP", self.lan_ip, "LAN_Mask", self.lan_mask
+        else:
+            return None
+        mask = DEFAULT_LAN_MASK if mask_position is None else self.field(values, mask_position)
+        return name, self.field(values, ip_position), mask_name, mask
+
+
+class SiteRecord:
+    """One inventory row, parsed once: stripped fields and addresses as integers.
+
+    `lan` is the FlatVlan LAN as (column, ip, mask, ip as int), `vlan_values`
+    the filled VLAN columns as (column, ip) and `vrf` the (VRF_Branch_IP,
+    VRF_Branch_Mask) pair. An IPv6 LAN has no int (None). VLAN addresses are
+    only parsed for InterVlan rows, by parse_vlans().
+    A malformed address is logged once, with its line number, and left out,
+    so its template field stays unchanged.
+    """
+
+    __slots__ = ("columns", "values", "line", "store", "template", "tnip1", "tnip2", "lan", "vlan_values", "vrf")
+
+    def __init__(self, columns, values, line=None, log=print):
+        if columns.store is None:
             raise KeyError("❌ CSV must have a 'StoreName' or similar column.")
+        field = columns.field
+        self.columns = columns
+        self.values = values
+        self.line = line
+        self.store = field(values, columns.store)
+        self.template = field(values, columns.template)
+        self.tnip1 = self._address("Tnip1", field(values, columns.tnip1), log)
+        self.tnip2 = self._address("Tnip2", field(values, columns.tnip2), log)
 
-        config = template
-
-        # --- Replace hostname ---
-        safe_hostname = row[store_key].strip().replace(" ", "_")
-        config = re.sub(
-            r"set hostname\s+\S+",
-            f"set hostname {safe_hostname}",
-            config
-        )
-        
-        print(f"\n🔧 Processing: {row[store_key].strip()}")
-        print(f"   📊 CSV Data Read:")
-        if "Tnip1" in row and row["Tnip1"].strip():
-            print(f"      Tnip1: {row['Tnip1'].strip()}")
-        if "Tnip2" in row and row["Tnip2"].strip():
-            print(f"      Tnip2: {row['Tnip2'].strip()}")
-        
-        # Show all VLAN values being read
-        for vlan in ["3100", "3137", "3138", "3139", "3140", "3141"]:
-            csv_key = f"VLAN{vlan}"
-            if csv_key in row and row[csv_key].strip():
-                print(f"      {csv_key}: {row[csv_key].strip()}")
-
-        # --- Replace TNIP1 & TNIP2 ---
-        if "Tnip1" in row and row["Tnip1"].strip():
-            config = re.sub(
-                r"(network tnip1[\s\S]*?ip address )[\d\.]+",
-                lambda m: m.group(1) + row["Tnip1"].strip(),
-                config
-            )
-        if "Tnip2" in row and row["Tnip2"].strip():
-            config = re.sub(
-                r"(network tnip2[\s\S]*?ip address )[\d\.]+",
-                lambda m: m.group(1) + row["Tnip2"].strip(),
-                config
-            )
-
-        # --- Template-specific processing ---
-        if is_flat_vlan:
-            # --- FlatVlan: Replace single BVI0 and LAN DHCP ---
-            # Support multiple column name variations
-            lan_ip_key = None
-            lan_mask_key = None
-            
-            # Check for BVI_IP or LAN_IP
-            if "BVI_IP" in row and row["BVI_IP"].strip():
-                lan_ip_key = "BVI_IP"
-                lan_mask_key = "Branch_Mask" if "Branch_Mask" in row else "BVI_Mask"
-            elif "LAN_IP" in row and row["LAN_IP"].strip():
-                lan_ip_key = "LAN_IP"
-                lan_mask_key = "LAN_Mask"
-            
-            if lan_ip_key and lan_ip_key in row and row[lan_ip_key].strip():
-                lan_ip = row[lan_ip_key].strip()
-                lan_mask = row.get(lan_mask_key, "255.255.255.192").strip()
-                
-                network_addr, range_start, range_end = compute_network_info(lan_ip, lan_mask)
-                
-                print(f"   📊 FlatVlan Network Info:")
-                print(f"      BVI IP: {lan_ip}")
-                print(f"      Mask: {lan_mask}")
-                print(f"      Network: {network_addr}")
-                print(f"      DHCP Range: {range_start} - {range_end}")
-
-                # --- BVI0 IP ---
-                config = re.sub(
-                    r"(network bvi0[\s\S]*?ip address )[\d\.]+",
-                    lambda m, ip=lan_ip: m.group(1) + ip,
-                    config
-                )
-
-                # --- DHCP network for "subnet lan" ---
-                config = re.sub(
-                    r"(subnet lan [\d]+ network )[\d\.]+ [\d\.]+",
-                    lambda m, net=network_addr, mk=lan_mask: m.group(1) + f"{net} {mk}",
-                    config
-                )
-
-                # --- DHCP range ---
-                config = re.sub(
-                    r"(subnet lan [\d]+ range )[\d\.]+ [\d\.]+",
-                    lambda m, start=range_start, end=range_end: m.group(1) + f"{start} {end}",
-                    config
-                )
-
-                # --- DHCP router ---
-                config = re.sub(
-                    r"(subnet lan [\d]+ router )[\d\.]+",
-                    lambda m, ip=lan_ip: m.group(1) + ip,
-                    config
-                )
-                
-                # --- VRF WAN2 route for FlatVlan: CRITICAL FIX ---
-                # Must use the SAME network address as DHCP (calculated from BVI_IP)
-                print(f"   🔧 VRF Route Update:")
-                print(f"      Target: route {network_addr} {lan_mask} loopback11")
-                
-                # Pattern to find any route with loopback11
-                route_pattern = r"route\s+[\d\.]+\s+[\d\.]+\s+loopback11"
-                match = re.search(route_pattern, config)
-                
-                if match:
-                    old_route = match.group(0)
-                    new_route = f"route {network_addr} {lan_mask} loopback11"
-                    
-                    # Replace only the first occurrence (should be in vrf wan2)
-                    config = config.replace(old_route, new_route, 1)
-                    
-                    print(f"      ✅ VRF Route Updated!")
-                    print(f"         Old: {old_route}")
-                    print(f"         New: {new_route}")
-                    
-                    # Verify replacement worked
-                    verify_match = re.search(r"route\s+[\d\.]+\s+[\d\.]+\s+loopback11", config)
-                    if verify_match and verify_match.group(0) == new_route:
-                        print(f"      ✓ Verification: SUCCESS")
-                    else:
-                        print(f"      ⚠️  Verification: Route found but may not match expected")
-                else:
-                    print(f"      ❌ ERROR: Could not find route with 'loopback11' in template!")
-                    print(f"      💡 Tip: Check template for line like 'route X.X.X.X X.X.X.X loopback11'")
+        self.lan = None
+        lan = columns.lan(values)
+        if lan:
+            name, ip, mask_name, mask = lan
+            ip_int = self._subnet(f"{name}/{mask_name}", ip, mask, log)
+            if ip_int is not False:
+                self.lan = (name, ip, mask, ip_int)
+
+        self.vlan_values = [(key, field(values, position)) for key, position in columns.vlans
+                            if field(values, position)]
+
+        self.vrf = None
+        vrf_ip, vrf_mask = field(values, columns.vrf_ip), field(values, columns.vrf_mask)
+        if vrf_ip and vrf_mask and self._subnet("VRF_Branch_IP/VRF_Branch_Mask", vrf_ip, vrf_mask, log) is not False:
+            self.vrf = (vrf_ip, vrf_mask)
+
+    @classmethod
+    def from_row(cls, row, log=print):
+        """Build a record from a row dict (rows passed in through the API)."""
+        header = [key for key in row if key is not None]
+        return cls(SiteColumns(header), [row[key] for key in header], None, log)
+
+    @property
+    def hostname(self):
+        return self.store.replace(" ", "_")
+
+    def as_dict(self):
+        """The row as csv.DictReader would have returned it."""
+        return _row_dict(self.columns.header, self.values)
+
+    def parse_vlans(self, log=print):
+        """Return the filled VLAN columns as (column, ip, ip as int); they must be IPv4, as the VLAN masks are."""
+        vlans = []
+        for key, ip in self.vlan_values:
+            ip_int = _ipv4_int(ip)
+            if ip_int is None:
+                self._report(key, ip, log)
+            else:
+                vlans.append((key, ip, ip_int))
+        return vlans
+
+    def _report(self, name, value, log):
+        where = f"Line {self.line} ({self.store})" if self.line else self.store
+        log(f"❌ {where}: invalid address in {name} '{value}' - left unchanged")
+
+    def _parse(self, name, ip, log):
+        """Return the address as an int (None for IPv6), or False if malformed."""
+        ip_int = _ipv4_int(ip)
+        if ip_int is None:
+            try:
+                ipaddress.ip_address(ip)
+            except ValueError:
+                self._report(name, ip, log)
+                return False
+        return ip_int
+
+    def _address(self, name, ip, log):
+        return ip if not ip or self._parse(name, ip, log) is not False else ""
+
+    def _subnet(self, name, ip, mask, log):
+        try:
+            _network_bounds(ip, mask)
+        except ValueError:
+            self._report(name, f"{ip} {mask}", log)
+            return False
+        return _ipv4_int(ip)
+
+
+def iter_site_records(csv_source, log=print, timer=None, shard=None):
+    """Yield a SiteRecord per CSV row; the header is resolved once for the file.
+
+    With `shard` (index, count) only the rows of that shard are parsed (see shard_of).
+    """
+    rows = iter_csv_values(csv_source, log, timer)
+    columns = SiteColumns(next(rows))
+    if shard is not None and columns.store is None:
+        raise KeyError("❌ CSV must have a 'StoreName' or similar column.")
+    for line, values in rows:
+        if shard is None or shard_of(columns.field(values, columns.store), shard[1]) == shard[0]:
+            yield SiteRecord(columns, values, line, log)
+
+
+# --- Row index: store -> byte offset of its CSV row ---
+ROW_INDEX_MAGIC = b"TELDAT-ROW-INDEX 1\n"
+ROW_INDEX_ENTRY = struct.Struct(">QQI")  # hostname hash, row byte offset, line number
+
+
+class _OffsetLines:
+    """Decoded lines of a binary file, tracking the byte offset of the next line."""
+
+    def __init__(self, f, offset=0):
+        self.f = f
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8")
+
+
+def _hostname_key(hostname):
+    return int.from_bytes(hashlib.sha256(hostname.encode("utf-8")).digest()[:8], "big")
+
+
+class RowIndex:
+    """On-disk index of an inventory CSV: store hostname -> byte offset of its row.
+
+    Built with one pass over the CSV and saved next to it (<csv>.teldat_index);
+    it is rebuilt when the CSV's size or mtime no longer match. The index
+    holds the delimiter, the header and one fixed-size entry per row, sorted
+    by a hash of the hostname, so finding a store is a binary search of a
+    few reads and only its own rows are read and parsed.
+    """
+
+    def __init__(self, csv_path, log=print):
+        self.csv_path = csv_path
+        self.path = f"{csv_path}{ROW_INDEX_SUFFIX}"
+        stat = os.stat(csv_path)
+        self._stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        self._file = self._open()
+        if self._file is None:
+            log(f"🗂️  Building row index of {csv_path}")
+            self._file = self._build(log)
+        info = json.loads(self._file.readline())
+        self.delimiter = info["delimiter"]
+        self.columns = SiteColumns(info["header"])
+        self.rows = info["rows"]
+        self._entries = self._file.tell()
+
+    def _open(self):
+        # The saved index, or None when missing, unreadable or stale
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return None
+        if f.readline() == ROW_INDEX_MAGIC:
+            position = f.tell()
+            try:
+                info = json.loads(f.readline())
+            except ValueError:
+                info = {}
+            if {key: info.get(key) for key in self._stamp} == self._stamp:
+                f.seek(position)
+                return f
+        f.close()
+        return None
+
+    def _build(self, log):
+        entries = []
+        with open(self.csv_path, "rb") as f:
+            lines = _OffsetLines(f)
+            first_line, header_line = "", 0
+            for line in lines:
+                header_line += 1
+                if line.strip():
+                    first_line = line.strip()
+                    break
+            delimiter, _ = detect_delimiter(first_line)
+
+            if delimiter:
+                f.seek(0)
+                lines = _OffsetLines(f)
+                reader = csv.reader(lines, delimiter=delimiter)
+                header = next(reader, [])
+                columns = SiteColumns(header)
+                rows = self._delimited_rows(lines, reader)
+            else:
+                header = _whitespace_values(first_line)
+                columns = SiteColumns(header)
+                rows = self._whitespace_rows(lines, header_line, len(header))
+            if columns.store is None:
+                raise KeyError("❌ CSV must have a 'StoreName' or similar column.")
+
+            for offset, values, line in rows:
+                if values:
+                    hostname = columns.field(values, columns.store).replace(" ", "_")
+                    entries.append((_hostname_key(hostname), offset, line))
+        entries.sort()
+
+        info = dict(self._stamp, delimiter=delimiter, header=header, rows=len(entries))
+        data = ROW_INDEX_MAGIC + json.dumps(info, ensure_ascii=False).encode("utf-8") + b"\n"
+        data += b"".join(ROW_INDEX_ENTRY.pack(*entry) for entry in entries)
+        try:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as out:
+                out.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            log(f"⚠️  Could not save the row index ({e}); it is kept in memory for this run")
+        index = io.BytesIO(data)
+        index.readline()
+        return index
+
+    @staticmethod
+    def _delimited_rows(lines, reader):
+        # (start offset, values, line number); csv.reader pulls one line at a time
+        while True:
+            offset = lines.offset
+            values = next(reader, None)
+            if values is None:
+                return
+            yield offset, values, reader.line_num
+
+    @staticmethod
+    def _whitespace_rows(lines, header_line, column_count):
+        # Rows with the wrong number of columns are skipped, as iter_csv_values does
+        number = header_line
+        while True:
+            offset = lines.offset
+            line = next(lines, None)
+            if line is None:
+                return
+            number += 1
+            values = _whitespace_values(line)
+            if values and len(values) == column_count:
+                yield offset, values, number
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _entry(self, position):
+        self._file.seek(self._entries + position * ROW_INDEX_ENTRY.size)
+        return ROW_INDEX_ENTRY.unpack(self._file.read(ROW_INDEX_ENTRY.size))
+
+    def locate(self, store):
+        """Return the (byte offset, line number) of every row of a store, in file order."""
+        key = _hostname_key(store.strip().replace(" ", "_"))
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.rows:
+            entry_key, offset, line = self._entry(low)
+            if entry_key != key:
+                break
+            found.append((offset, line))
+            low += 1
+        return found
+
+    def read_row(self, f, offset):
+        """Parse the row starting at `offset` of the open binary CSV file `f`."""
+        f.seek(offset)
+        lines = _OffsetLines(f, offset)
+        if self.delimiter:
+            return next(csv.reader(lines, delimiter=self.delimiter))
+        return _whitespace_values(next(lines))
+
+    def records(self, stores, log=print):
+        """Yield the SiteRecords of the named stores (name or hostname), in CSV order.
+
+        A name with no row in the CSV is logged as an error.
+        """
+        wanted = {}
+        for store in stores:
+            hostname = store.strip().replace(" ", "_")
+            rows = self.locate(hostname)
+            if not rows:
+                log(f"❌ Store '{store.strip()}' not found in {self.csv_path}")
+            for offset, line in rows:
+                wanted[offset] = (line, hostname)
+        with open(self.csv_path, "rb") as f:
+            for offset in sorted(wanted):
+                line, hostname = wanted[offset]
+                record = SiteRecord(self.columns, self.read_row(f, offset), line, log)
+                if record.hostname == hostname:  # Not a hash collision
+                    yield record
+
+
+def iter_store_records(csv_path, stores, log=print):
+    """Yield the SiteRecords of the named stores, reading only their rows (see RowIndex)."""
+    if not isinstance(csv_path, (str, os.PathLike)):
+        raise ValueError("❌ Looking up single stores needs the CSV as a file path.")
+    with RowIndex(csv_path, log) as index:
+        yield from index.records(stores, log)
+
+
+# --- VLAN profiles: VLAN -> mask sets with precompiled patterns ---
+class VlanProfile:
+    """A named VLAN -> mask mapping for InterVlan templates.
 
+    The four substitution patterns of every VLAN are compiled once, here, and
+    reused for every template and row that uses the profile. Two profiles
+    with the same name and masks are equal (and hash alike), so they share
+    compile_template cache entries, also across worker processes.
+    """
+
+    def __init__(self, name, masks):
+        self.name = name
+        self.masks = {str(vlan): _normalize_mask(mask, name, vlan) for vlan, mask in masks.items()}
+        self.columns = {f"VLAN{vlan}": (index, vlan, mask) for index, (vlan, mask) in enumerate(self.masks.items())}
+        self.points = []
+        for vlan in self.masks:
+            self.points += [
+                (("bvi", vlan), re.compile(rf"(network bvi0\.{vlan}(?=\s)[\s\S]*?ip address )[\d\.]+")),
+                (("network", vlan), re.compile(rf"(subnet vlan{vlan} [\d]+ network )[\d\.]+ [\d\.]+")),
+                (("range", vlan), re.compile(rf"(subnet vlan{vlan} [\d]+ range )[\d\.]+ [\d\.]+")),
+                (("router", vlan), re.compile(rf"(subnet vlan{vlan} [\d]+ router )[\d\.]+")),
+            ]
+        self._identity = (name, tuple(self.masks.items()))
+
+    def __eq__(self, other):
+        return isinstance(other, VlanProfile) and self._identity == other._identity
+
+    def __hash__(self):
+        return hash(self._identity)
+
+    def __repr__(self):
+        return f"VlanProfile({self.name!r}, {len(self.masks)} VLANs)"
+
+    @property
+    def is_default(self):
+        return self.masks == VLAN_MASK_MAP
+
+    def populated(self, row):
+        """Return (csv_key, vlan, mask, ip, ip as int) for the VLAN columns a row fills, in profile order.
+
+        `row` is a list of (csv_key, ip, ip as int), as SiteRecord.parse_vlans
+        returns, or a row dict (no int, None). Only the VLAN columns the row
+        fills are looked up, so the cost does not grow with the size of the profile.
+        """
+        if isinstance(row, list):
+            entries = row
         else:
-            # --- InterVlan: Replace VLANs and DHCP settings ---
-            for vlan, mask in VLAN_MASK_MAP.items():
-                csv_key = f"VLAN{vlan}"
-                if csv_key not in row or not row[csv_key].strip():
+            entries = [(key, value.strip(), None) for key, value in row.items()
+                       if isinstance(value, str) and value.strip()]
+        found = []
+        for csv_key, ip, ip_int in entries:
+            column = self.columns.get(csv_key)
+            if column is not None:
+                found.append((column[0], csv_key, column[1], column[2], ip, ip_int))
+        found.sort()
+        return [entry[1:] for entry in found]
+
+
+def _normalize_mask(mask, profile, vlan):
+    """Return a mask given as dotted quad, "/N" or N as a dotted quad."""
+    try:
+        return str(ipaddress.IPv4Network(f"0.0.0.0/{str(mask).lstrip('/')}").netmask)
+    except ValueError:
+        raise ValueError(f"❌ VLAN profile '{profile}': invalid mask '{mask}' for VLAN {vlan}") from None
+
+
+DEFAULT_VLAN_PROFILE = VlanProfile(DEFAULT_VLAN_PROFILE_NAME, VLAN_MASK_MAP)
+
+
+class VlanProfiles:
+    """Named VLAN profiles and the profile each template uses, read from a JSON file.
+
+    The file holds {"profiles": {name: {vlan: mask}}, "templates": {template
+    name: profile name}}; masks are dotted quads or prefix lengths ("/28").
+    Templates not listed use the file's "default" profile, or the built-in
+    VLAN_MASK_MAP when the file has none.
+    """
+
+    def __init__(self, profiles=None, templates=None):
+        self.profiles = {DEFAULT_VLAN_PROFILE_NAME: DEFAULT_VLAN_PROFILE}
+        for name, masks in (profiles or {}).items():
+            self.profiles[name] = VlanProfile(name, masks)
+        self.templates = {}
+        for template, name in (templates or {}).items():
+            self.get(name)
+            for alias in (template, os.path.splitext(template)[0]):
+                self.templates.setdefault(alias.lower(), name)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("profiles"), data.get("templates"))
+
+    def get(self, name):
+        if name not in self.profiles:
+            raise KeyError(f"❌ Unknown VLAN profile '{name}' (known: {', '.join(self.profiles)})")
+        return self.profiles[name]
+
+    def for_template(self, template_name):
+        """Return the profile of a template, by file name with or without extension."""
+        name = os.path.basename(template_name or "")
+        return self.get(self.templates.get(name.lower())
+                        or self.templates.get(os.path.splitext(name)[0].lower())
+                        or DEFAULT_VLAN_PROFILE_NAME)
+
+
+def merge_vlan_profiles(profiles):
+    """One profile with the VLANs of every profile given (the first mask of a VLAN wins)."""
+    profiles = list(profiles)
+    if len(set(profiles)) == 1:
+        return profiles[0]
+    masks = {}
+    for profile in profiles:
+        for vlan, mask in profile.masks.items():
+            masks.setdefault(vlan, mask)
+    return VlanProfile("+".join(dict.fromkeys(profile.name for profile in profiles)), masks)
+
+
+# --- Template compiler: substitution points ---
+HOSTNAME_PATTERN = re.compile(r"set hostname\s+\S+")
+LOOPBACK_ROUTE_PATTERN = re.compile(r"route\s+[\d\.]+\s+[\d\.]+\s+loopback11")
+VRF_WAN2_PATTERN = re.compile(r"(vrf wan2[\s\S]*?)(?=^vrf |\Z)", flags=re.MULTILINE)
+COMMON_POINTS = [
+    ("hostname", HOSTNAME_PATTERN),
+    ("tnip1", re.compile(r"(network tnip1[\s\S]*?ip address )[\d\.]+")),
+    ("tnip2", re.compile(r"(network tnip2[\s\S]*?ip address )[\d\.]+")),
+]
+FLAT_VLAN_POINTS = [
+    (("bvi", "lan"), re.compile(r"(network bvi0(?=\s)[\s\S]*?ip address )[\d\.]+")),
+    (("network", "lan"), re.compile(r"(subnet lan [\d]+ network )[\d\.]+ [\d\.]+")),
+    (("range", "lan"), re.compile(r"(subnet lan [\d]+ range )[\d\.]+ [\d\.]+")),
+    (("router", "lan"), re.compile(r"(subnet lan [\d]+ router )[\d\.]+")),
+]
+
+
+def substitution_points(is_flat_vlan, vlan_profile=None):
+    """Return the ordered (key, pattern) pairs substituted into every config.
+
+    Patterns with a capture group replace only the text following the group
+    (the IP part); patterns without a group replace the whole match.
+    The order is the order in which the original regex chain applied them.
+    All patterns are precompiled; InterVlan ones come from `vlan_profile`.
+    """
+    if is_flat_vlan:
+        return COMMON_POINTS + FLAT_VLAN_POINTS
+    return COMMON_POINTS + (vlan_profile or DEFAULT_VLAN_PROFILE).points
+
+
+def _replacement(value):
+    return lambda m: (m.group(1) + value) if m.re.groups else value
+
+
+def _key_kind(key):
+    return key[0] if isinstance(key, tuple) else key
+
+
+def _is_vlan_key(key):
+    return isinstance(key, tuple) and key[1] != "lan"
+
+
+def render_config_regex(template, is_flat_vlan, values, timer=None, vlan_profile=None):
+    """Reference renderer: apply every substitution as a full-text regex pass.
+
+    `values` maps substitution keys to replacement text (see
+    substitution_points, plus "route" for the loopback11 route).
+    Used when a template cannot be compiled and to validate CompiledTemplate.
+    """
+    timer = timer or NO_INSTRUMENTATION
+    config = template
+    for key, pattern in substitution_points(is_flat_vlan, vlan_profile):
+        if key in values:
+            with timer.phase(f"regex:{_key_kind(key)}"):
+                config = pattern.sub(_replacement(values[key]), config)
+            timer.count("regex_calls")
+
+    if "route" in values:
+        timer.count("regex_calls", 1 if is_flat_vlan else 2)
+        with timer.phase("regex:route"):
+            config = _replace_route_regex(config, is_flat_vlan, values["route"])
+    return config
+
+
+def _replace_route_regex(config, is_flat_vlan, route):
+    if is_flat_vlan:
+        match = LOOPBACK_ROUTE_PATTERN.search(config)
+        if match:
+            config = config.replace(match.group(0), route, 1)
+    else:
+        match = VRF_WAN2_PATTERN.search(config)
+        if match:
+            vrf_block = match.group(1)
+            vrf_block_updated = LOOPBACK_ROUTE_PATTERN.sub(_replacement(route), vrf_block, count=1)
+            config = config.replace(vrf_block, vrf_block_updated)
+    return config
+
+
+# --- Structural config model ---
+BLOCK_KEYWORDS = ("network", "feature", "protocol", "vrf")
+SUBNET_FIELDS = {"network": 2, "range": 2, "router": 1}  # DHCP subnet kind -> number of address values
+
+
+def _address_length(text, start):
+    """Length of the run of digits and dots at text[start:] (an IP or mask)."""
+    end = start
+    while end < len(text) and (text[end].isdigit() or text[end] == "."):
+        end += 1
+    return end - start
+
+
+class ConfigBlock:
+    """One top-level block of a Teldat config (`network tnip1`, `vrf wan2`, ...).
+
+    `fields` holds the (start, end) span, in the config text, of the values
+    the generator edits: "ip address" (interface address) and "route" (first
+    loopback11 route).
+    """
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.fields = {}
+
+
+class ConfigModel:
+    """A Teldat config parsed once into its top-level blocks.
+
+    Blocks are indexed by header line (`model.blocks["network bvi0.3100"]`);
+    hostname lines, DHCP `subnet` entries (keyed by (scope, kind), e.g.
+    ("vlan3100", "range")) and loopback11 routes are indexed by position, so
+    every value the generator writes is found by lookup, not by a text search.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.blocks = {}
+        self.hostnames = []  # spans of "set hostname X" lines
+        self.subnets = {}  # (scope, kind) -> spans of the address value(s)
+        self.routes = []  # spans of loopback11 route lines, in config order
+
+        block = None
+        offset = 0
+        for line in text.split("\n"):
+            content = line.rstrip("\r")
+            stripped = content.lstrip()
+            start = offset + len(content) - len(stripped)
+            offset += len(line) + 1
+            if not stripped or stripped.startswith(";"):
+                continue
+            words = stripped.split()
+            if len(stripped) == len(content):
+                # Column 0: block header, end of block or a global command
+                if words == ["exit"] and block is not None:
+                    block.end = offset
+                    block = None
                     continue
+                if words[0] in BLOCK_KEYWORDS:
+                    block = ConfigBlock(" ".join(words), start)
+                    self.blocks.setdefault(block.name, block)
+                    continue
+            self._index_line(block, stripped, words, start)
 
-                vlan_ip = row[csv_key].strip()
-                network_addr, range_start, range_end = compute_network_info(vlan_ip, mask)
-                
-                print(f"   ✏️  Updating {csv_key}: {vlan_ip} → Network: {network_addr}/{mask}")
-
-                # --- BVI IP ---
-                config = re.sub(
-                    rf"(network bvi0\.{vlan}[\s\S]*?ip address )[\d\.]+",
-                    lambda m, ip=vlan_ip: m.group(1) + ip,
-                    config
-                )
-
-                # --- DHCP network ---
-                config = re.sub(
-                    rf"(subnet vlan{vlan} [\d]+ network )[\d\.]+ [\d\.]+",
-                    lambda m, net=network_addr, mk=mask: m.group(1) + f"{net} {mk}",
-                    config
-                )
-
-                # --- DHCP range ---
-                config = re.sub(
-                    rf"(subnet vlan{vlan} [\d]+ range )[\d\.]+ [\d\.]+",
-                    lambda m, start=range_start, end=range_end: m.group(1) + f"{start} {end}",
-                    config
-                )
-
-                # --- DHCP router ---
-                config = re.sub(
-                    rf"(subnet vlan{vlan} [\d]+ router )[\d\.]+",
-                    lambda m, ip=vlan_ip: m.group(1) + ip,
-                    config
-                )
-
-        # --- Replace VRF WAN2 route (for InterVlan only, FlatVlan handles it above) ---
-        if not is_flat_vlan:
-            new_ip = row.get("VRF_Branch_IP", "").strip()
-            new_mask = row.get("VRF_Branch_Mask", "").strip()
-            if new_ip and new_mask:
-                pattern_vrf_wan2 = r"(vrf wan2[\s\S]*?)(?=^vrf |\Z)"
-                match = re.search(pattern_vrf_wan2, config, flags=re.MULTILINE)
-                if match:
-                    vrf_block = match.group(1)
-                    vrf_block_updated = re.sub(
-                        r"route\s+[\d\.]+\s+[\d\.]+\s+loopback11",
-                        f"route {new_ip} {new_mask} loopback11",
-                        vrf_block,
-                        count=1
-                    )
-                    config = config.replace(vrf_block, vrf_block_updated)
-                    print(f"   ✏️  VRF Route: {new_ip} {new_mask} loopback11")
-
-        # --- Save output file ---
-        safe_store_name = safe_hostname
-        output_path = os.path.join(OUTPUT_DIR, f"{safe_store_name}_TELDAT_CONFIG.txt")
-        with open(output_path, "w", encoding="utf-8") as out:
-            out.write(config)
+    def _index_line(self, block, stripped, words, start):
+        if stripped.startswith("set hostname ") and len(words) > 2:
+            end = stripped.index(words[2], len("set hostname")) + len(words[2])
+            self.hostnames.append((start, start + end))
+        elif stripped.startswith("ip address ") and block is not None and "ip address" not in block.fields:
+            value = start + len("ip address ")
+            length = _address_length(self.text, value)
+            if length:
+                block.fields["ip address"] = (value, value + length)
+        elif stripped.startswith("subnet "):
+            parts = stripped.split(" ")
+            count = SUBNET_FIELDS.get(parts[3]) if len(parts) > 3 and parts[2].isdigit() else None
+            if count and len(parts) >= 4 + count:
+                value = start + len(" ".join(parts[:4])) + 1
+                end = value
+                for part in parts[4:4 + count]:
+                    length = _address_length(part, 0)
+                    if not length:
+                        return
+                    end += length + 1
+                self.subnets.setdefault((parts[1], parts[3]), []).append((value, end - 1))
+        elif words[0] == "route" and len(words) > 3 and words[3] == "loopback11":
+            span = (start, start + stripped.index("loopback11") + len("loopback11"))
+            self.routes.append(span)
+            if block is not None:
+                block.fields.setdefault("route", span)
+
+    def field(self, key, is_flat_vlan):
+        """Spans written by substitution `key` (see substitution_points)."""
+        if key == "hostname":
+            return self.hostnames
+        if key == "route":
+            if is_flat_vlan:
+                return self.routes[:1]
+            vrf = self.blocks.get("vrf wan2")
+            return [vrf.fields["route"]] if vrf and "route" in vrf.fields else []
+        if isinstance(key, tuple):
+            kind, vlan = key
+            if kind != "bvi":
+                scope = "lan" if vlan == "lan" else f"vlan{vlan}"
+                return self.subnets.get((scope, kind), [])
+            name = "network bvi0" if vlan == "lan" else f"network bvi0.{vlan}"
+        else:
+            name = f"network {key}"
+        block = self.blocks.get(name)
+        return [block.fields["ip address"]] if block and "ip address" in block.fields else []
+
+    def locate(self, is_flat_vlan, vlan_profile=None):
+        """Return (spans, route_text, has_vrf_wan2) for CompiledTemplate."""
+        keys = [key for key, _ in substitution_points(is_flat_vlan, vlan_profile)] + ["route"]
+        spans = [(start, end, order, key)
+                 for order, key in enumerate(keys)
+                 for start, end in self.field(key, is_flat_vlan)]
+        route = self.field("route", is_flat_vlan)
+        route_text = self.text[route[0][0]:route[0][1]] if route else None
+        return sorted(spans), route_text, not is_flat_vlan and "vrf wan2" in self.blocks
+
+
+def slot_name(key):
+    """Name of the template field written by substitution `key`, for messages."""
+    if key == "hostname":
+        return "set hostname"
+    if key == "route":
+        return "loopback11 route"
+    if isinstance(key, tuple):
+        kind, vlan = key
+        if kind == "bvi":
+            return "network bvi0 ip address" if vlan == "lan" else f"network bvi0.{vlan} ip address"
+        return f"subnet {'lan' if vlan == 'lan' else f'vlan{vlan}'} {kind}"
+    return f"network {key} ip address"
+
+
+def locate_with_regex(template, is_flat_vlan, vlan_profile=None):
+    """Return (spans, route_text, has_vrf_wan2) found by the regex chain."""
+    points = substitution_points(is_flat_vlan, vlan_profile)
+    spans = []
+    for order, (key, pattern) in enumerate(points):
+        for m in pattern.finditer(template):
+            start = m.end(1) if pattern.groups else m.start()
+            spans.append((start, m.end(), order, key))
+
+    route_order = len(points)
+    # Original loopback11 route text (FlatVlan) / whether vrf wan2 exists (InterVlan)
+    route_text = None
+    has_vrf_wan2 = False
+    if is_flat_vlan:
+        match = LOOPBACK_ROUTE_PATTERN.search(template)
+        if match:
+            route_text = match.group(0)
+            spans.append((match.start(), match.end(), route_order, "route"))
+    else:
+        match = VRF_WAN2_PATTERN.search(template)
+        if match:
+            has_vrf_wan2 = True
+            vrf_block = match.group(1)
+            route = LOOPBACK_ROUTE_PATTERN.search(vrf_block)
+            if route:
+                route_text = route.group(0)
+                # str.replace rewrites every copy of the block, so does the plan
+                offset = template.find(vrf_block)
+                while offset != -1:
+                    spans.append((offset + route.start(), offset + route.end(), route_order, "route"))
+                    offset = template.find(vrf_block, offset + len(vrf_block))
+    return sorted(spans), route_text, has_vrf_wan2
+
+
+class CompiledTemplate:
+    """A template parsed once into literal segments and substitution slots.
+
+    The slots come from the template's ConfigModel: each value is located by
+    block lookup, and rendering a store is a join of the precomputed segments
+    with that row's values. The regex chain is only run once here, as a
+    cross-check: when it disagrees with the model (a malformed or unusual
+    template), its spans are used so the output stays identical, except for
+    the VLAN fields, which the model finds by their exact block name.
+    With use_regex=True every render goes through render_config_regex,
+    which gives a reference output for equivalence checks.
+    `vlan_profile` (InterVlan) sets the VLANs and masks; None is the default.
+    """
+
+    def __init__(self, template, is_flat_vlan, use_regex=False, vlan_profile=None):
+        self.template = template
+        self.is_flat_vlan = is_flat_vlan
+        self.vlan_profile = vlan_profile or DEFAULT_VLAN_PROFILE
+        self.model = ConfigModel(template)
+
+        located = self.model.locate(is_flat_vlan, self.vlan_profile)
+        regex_located = locate_with_regex(template, is_flat_vlan, self.vlan_profile)
+        self.structural = located == regex_located
+        if self.structural:
+            spans, self.route_text, self.has_vrf_wan2 = located
+        else:
+            spans, self.route_text, self.has_vrf_wan2 = regex_located
+            if not is_flat_vlan:
+                spans = sorted([span for span in spans if not _is_vlan_key(span[3])]
+                               + [span for span in located[0] if _is_vlan_key(span[3])])
+        self.slot_keys = {key for _, _, _, key in spans}
+
+        # Group identical spans (later substitutions win); partial overlaps
+        # cannot be expressed as segments, so fall back to the regex chain.
+        self.compiled = True
+        self._parts = []
+        self._slots = []
+        position = 0
+        for start, end, order, key in spans:
+            if self._slots and (start, end) == self._slots[-1][1]:
+                self._slots[-1][2].append(key)
+                continue
+            if start < position:
+                self.compiled = False
+                break
+            self._parts.append(template[position:start])
+            self._parts.append(template[start:end])
+            self._slots.append((len(self._parts) - 1, (start, end), [key]))
+            position = end
+        self._parts.append(template[position:])
+        # Keys are stored in application order; render checks the last first
+        self._slots = [(index, keys[::-1]) for index, _, keys in self._slots]
+        if use_regex:
+            self.compiled = False
+
+    def render(self, values, timer=None):
+        if not self.compiled:
+            return render_config_regex(self.template, self.is_flat_vlan, values, timer, self.vlan_profile)
+        parts = self._parts[:]
+        for index, keys in self._slots:
+            for key in keys:
+                if key in values:
+                    parts[index] = values[key]
+                    break
+        return "".join(parts)
+
+    def delta(self, values, timer=None):
+        """Return one store's value for each slot, None where the template text is kept.
+
+        rebuild_config(*self.segments(), delta) gives back render(values); a
+        template that is not compiled has a single slot holding the whole config.
+        """
+        if not self.compiled:
+            return [self.render(values, timer)]
+        delta = []
+        for _, keys in self._slots:
+            for key in keys:
+                if key in values:
+                    delta.append(values[key])
+                    break
+            else:
+                delta.append(None)
+        return delta
+
+    def segments(self):
+        """Return (literals, defaults): the text between the slots and the template text in each."""
+        if not self.compiled:
+            return ["", ""], [self.template]
+        return self._parts[0::2], self._parts[1::2]
+
+
+def rebuild_config(literals, defaults, delta):
+    """Join a template's segments with one store's slot values (see CompiledTemplate.delta)."""
+    parts = [literals[0]]
+    for default, value, literal in zip(defaults, delta, literals[1:]):
+        parts.append(default if value is None else value)
+        parts.append(literal)
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=COMPILED_TEMPLATE_CACHE_SIZE)
+def compile_template(template, is_flat_vlan, vlan_profile=None):
+    """Return the CompiledTemplate of a template, reusing earlier compilations.
+
+    CompiledTemplate is read-only once built, so one instance can be shared by
+    every run (and thread) that uses the same template and VLAN profile.
+    """
+    return CompiledTemplate(template, is_flat_vlan, vlan_profile=vlan_profile)
+
+
+# --- Render one store ---
+def find_store_key(row):
+    store_key = next((k for k in row.keys() if "store" in k.lower()), None)
+    if not store_key:
+        raise KeyError("❌ CSV must have a 'StoreName' or similar column.")
+    return store_key
+
+
+def render_store(compiled_template, row, log=print, reserve_count=DEFAULT_RESERVE_COUNT, timer=None, delta=False,
+                 verbose=True):
+    """Return (safe_hostname, config) for one site, logging each step.
+
+    `row` is a SiteRecord, or a CSV row dict that is parsed into one here.
+    With delta=True the config is returned as its slot values (CompiledTemplate.delta).
+    With verbose=False only warnings and errors are logged; the detail
+    messages are not even built.
+    """
+    timer = timer or NO_INSTRUMENTATION
+    record = row if isinstance(row, SiteRecord) else SiteRecord.from_row(row, log)
+
+    # --- Replace hostname ---
+    safe_hostname = record.hostname
+    values = {"hostname": f"set hostname {safe_hostname}"}
+    
+    if verbose:
+        log(f"\n🔧 Processing: {record.store}")
+        log(f"   📊 CSV Data Read:")
+        if record.tnip1:
+            log(f"      Tnip1: {record.tnip1}")
+        if record.tnip2:
+            log(f"      Tnip2: {record.tnip2}")
+    
+    # Show all VLAN values being read (only InterVlan parses them as addresses)
+    if compiled_template.is_flat_vlan:
+        vlans = compiled_template.vlan_profile.populated([(key, ip, None) for key, ip in record.vlan_values])
+    else:
+        vlans = compiled_template.vlan_profile.populated(record.parse_vlans(log))
+    if verbose:
+        for csv_key, _, _, vlan_ip, _ in vlans:
+            log(f"      {csv_key}: {vlan_ip}")
+
+    # --- Replace TNIP1 & TNIP2 ---
+    if record.tnip1:
+        values["tnip1"] = record.tnip1
+    if record.tnip2:
+        values["tnip2"] = record.tnip2
+
+    # --- Template-specific processing ---
+    if compiled_template.is_flat_vlan:
+        # --- FlatVlan: Replace single BVI0 and LAN DHCP ---
+        # BVI_IP / LAN_IP and their mask columns are resolved by SiteRecord
+        if record.lan:
+            _, lan_ip, lan_mask, lan_ip_int = record.lan
+            
+            with timer.phase("network_info"):
+                network_addr, range_start, range_end = site_network_info(lan_ip, lan_ip_int, lan_mask, reserve_count)
+            
+            if verbose:
+                log(f"   📊 FlatVlan Network Info:")
+                log(f"      BVI IP: {lan_ip}")
+                log(f"      Mask: {lan_mask}")
+                log(f"      Network: {network_addr}")
+                log(f"      DHCP Range: {range_start} - {range_end}")
+
+            # --- BVI0 IP and DHCP "subnet lan" network / range / router ---
+            values[("bvi", "lan")] = lan_ip
+            values[("network", "lan")] = f"{network_addr} {lan_mask}"
+            values[("range", "lan")] = f"{range_start} {range_end}"
+            values[("router", "lan")] = lan_ip
+            
+            # --- VRF WAN2 route for FlatVlan: CRITICAL FIX ---
+            # Must use the SAME network address as DHCP (calculated from BVI_IP)
+            if verbose:
+                log(f"   🔧 VRF Route Update:")
+                log(f"      Target: route {network_addr} {lan_mask} loopback11")
+            
+            if compiled_template.route_text:
+                old_route = compiled_template.route_text
+                new_route = f"route {network_addr} {lan_mask} loopback11"
+                
+                # Replaces only the first loopback11 route (should be in vrf wan2)
+                values["route"] = new_route
+                
+                if verbose:
+                    log(f"      ✅ VRF Route Updated!")
+                    log(f"         Old: {old_route}")
+                    log(f"         New: {new_route}")
+            else:
+                log(f"      ❌ ERROR: Could not find route with 'loopback11' in template!")
+                if verbose:
+                    log(f"      💡 Tip: Check template for line like 'route X.X.X.X X.X.X.X loopback11'")
+
+    else:
+        # --- InterVlan: Replace VLANs and DHCP settings ---
+        for csv_key, vlan, mask, vlan_ip, vlan_ip_int in vlans:
+            with timer.phase("network_info"):
+                network_addr, range_start, range_end = site_network_info(vlan_ip, vlan_ip_int, mask, reserve_count)
+            
+            if verbose:
+                log(f"   ✏️  Updating {csv_key}: {vlan_ip} → Network: {network_addr}/{mask}")
+
+            # --- BVI IP and DHCP network / range / router ---
+            values[("bvi", vlan)] = vlan_ip
+            values[("network", vlan)] = f"{network_addr} {mask}"
+            values[("range", vlan)] = f"{range_start} {range_end}"
+            values[("router", vlan)] = vlan_ip
+
+    # --- Replace VRF WAN2 route (for InterVlan only, FlatVlan handles it above) ---
+    if not compiled_template.is_flat_vlan:
+        if record.vrf:
+            new_ip, new_mask = record.vrf
+            if compiled_template.has_vrf_wan2:
+                values["route"] = f"route {new_ip} {new_mask} loopback11"
+                if verbose:
+                    log(f"   ✏️  VRF Route: {new_ip} {new_mask} loopback11")
+
+    # --- Verify every value has a field to go to (index lookup, no text search) ---
+    missing = [slot_name(key) for key in values if key not in compiled_template.slot_keys]
+    if missing:
+        log(f"   ⚠️  Not found in template, left unchanged: {', '.join(missing)}")
+
+    with timer.phase("render"):
+        if delta:
+            config = compiled_template.delta(values, timer)
+        else:
+            config = compiled_template.render(values, timer)
+    if verbose and compiled_template.is_flat_vlan and "route" in values and "route" in compiled_template.slot_keys:
+        log(f"      ✓ Verification: SUCCESS")  # The route slot was filled by render
+    if timer.enabled:
+        for key in values:
+            timer.count(f"substitutions:{_key_kind(key)}")
+
+    return safe_hostname, config
+
+
+# --- Serial and parallel rendering ---
+def iter_rendered_serial(templates, read_rows, log=print, reserve_count=DEFAULT_RESERVE_COUNT, timer=None,
+                         delta=False, verbose=True):
+    """Yield (template name, safe_hostname, config, log_lines) in CSV order in this process.
+
+    `templates` maps a template name to (template text, is_flat_vlan, vlan_profile).
+    `read_rows(log)` returns an iterator of (template name, row) pairs;
+    reader messages go straight to `log`, each store's own messages are
+    returned in log_lines (only warnings and errors unless `verbose`).
+    """
+    timer = timer or NO_INSTRUMENTATION
+    # --- Compile each template once for all stores ---
+    with timer.phase("compile"):
+        compiled_templates = {name: compile_template(*template) for name, template in templates.items()}
+    for name, row in read_rows(log):
+        lines = []
+        start = time.perf_counter()
+        safe_hostname, config = render_store(compiled_templates[name], row, lines.append, reserve_count, timer, delta,
+                                             verbose)
+        timer.store(safe_hostname, time.perf_counter() - start)
+        yield name, safe_hostname, config, lines
+
+
+_worker_templates = {}
+_worker_reserve_count = DEFAULT_RESERVE_COUNT
+_worker_verbose = True
+_worker_top_n = None
+_worker_delta = False
+
+
+def _init_worker(templates, reserve_count, verbose, top_n, delta=False):
+    # Compile the templates once per worker process
+    global _worker_templates, _worker_reserve_count, _worker_verbose, _worker_top_n, _worker_delta
+    _worker_templates = {name: compile_template(*template) for name, template in templates.items()}
+    _worker_reserve_count = reserve_count
+    _worker_verbose = verbose
+    _worker_top_n = top_n
+    _worker_delta = delta
+
+
+def _render_chunk(chunk):
+    """Render a chunk of rows in a worker; log lines are returned, not printed.
+
+    Returns (results, measurements); measurements is None unless the run is
+    instrumented (top_n set).
+    """
+    timer = Instrumentation(_worker_top_n) if _worker_top_n else NO_INSTRUMENTATION
+    results = []
+    for item in chunk:
+        if isinstance(item, str):
+            results.append((None, None, None, [item]))
+            continue
+        name, row = item
+        lines = []
+        start = time.perf_counter()
+        # Only warnings and errors are shown unless verbose, so only those are built and shipped back
+        safe_hostname, config = render_store(_worker_templates[name], row, lines.append, _worker_reserve_count, timer,
+                                             _worker_delta, _worker_verbose)
+        timer.store(safe_hostname, time.perf_counter() - start)
+        results.append((name, safe_hostname, config, lines))
+    return results, (timer.to_dict() if timer.enabled else None)
+
+
+def iter_chunks(read_rows, chunk_size):
+    """Yield lists of (template name, row) items and reader messages, in file order."""
+    chunk = []
+    # The lambda looks up the current chunk, so messages stay in file order
+    for row in read_rows(lambda message: chunk.append(message)):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_rendered_parallel(templates, read_rows, workers, chunk_size=DEFAULT_CHUNK_SIZE,
+                           reserve_count=DEFAULT_RESERVE_COUNT, verbose=True, timer=None, delta=False):
+    """Yield (template name, safe_hostname, config, log_lines) in CSV order using a process pool.
+
+    Only a bounded number of chunks is in flight at once, so memory stays
+    flat for any inventory size.
+    """
+    timer = timer or NO_INSTRUMENTATION
+    top_n = timer.top_n if timer.enabled else None
+
+    def collect(future):
+        results, measurements = future.result()
+        if measurements is not None:
+            timer.merge(measurements)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(templates, reserve_count, verbose, top_n, delta)) as executor:
+        pending = []
+        for chunk in iter_chunks(read_rows, chunk_size):
+            pending.append(executor.submit(_render_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from collect(pending.pop(0))
+        for future in pending:
+            yield from collect(future)
+
+
+# --- Incremental runs: content-hash manifest ---
+class Manifest:
+    """Per-store content hashes of the configs in an output folder.
+
+    A store's hash covers the content of its template, its normalized CSV row, the
+    generator version, the reserve count and a non-default VLAN profile.
+    Rows whose hash matches the previous run (and whose output file still
+    exists) are skipped. Rows sharing an output file (duplicate hostnames)
+    are always regenerated, in CSV order, so the later row still wins; the
+    manifest keeps the list of their hashes for that file.
+    """
+
+    def __init__(self, output_dir, template_text, reserve_count=DEFAULT_RESERVE_COUNT, vlan_profile=None):
+        # template_text: the template, or {template name: template} for a mixed batch;
+        # vlan_profile: a VlanProfile, or {template name: VlanProfile} for a mixed batch
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        if isinstance(template_text, str):
+            template_text = {None: template_text}
+        if not isinstance(vlan_profile, dict):
+            vlan_profile = dict.fromkeys(template_text, vlan_profile)
+        self._prefixes = {}
+        for name, text in template_text.items():
+            key = f"{GENERATOR_VERSION}\0{reserve_count}\0{text}"
+            profile = vlan_profile.get(name)
+            if profile is not None and not profile.is_default:
+                key += "\0" + json.dumps(profile.masks)
+            self._prefixes[name] = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        self.previous = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.previous = json.load(f).get("stores", {})
+        self._rows = {}  # filename -> hashes of this run's rows for it, in CSV order
+        self._pending = {}  # filename -> rows yielded but not written yet
+        self._kept = {}
+        self.skipped = 0
+
+    def row_hash(self, row, template=None):
+        if isinstance(row, SiteRecord):
+            row = row.as_dict()
+        normalized = sorted((str(k).strip(), str(v).strip()) for k, v in row.items())
+        payload = self._prefixes[template] + json.dumps(normalized, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def changed_rows(self, rows):
+        """Yield the (template name, SiteRecord) pairs whose config must be regenerated."""
+        for name, row in rows:
+            filename = config_filename(row.hostname)
+            digest = self.row_hash(row, name)
+            digests = self._rows.setdefault(filename, [])
+            digests.append(digest)
+            # A previous run's list of hashes (duplicate hostnames) never matches a single row
+            if (len(digests) == 1 and self.previous.get(filename) == digest
+                    and os.path.exists(os.path.join(self.output_dir, filename))):
+                self.skipped += 1
+                continue
+            self._pending[filename] = self._pending.get(filename, 0) + 1
+            yield name, row
+
+    def mark_written(self, filename):
+        if self._pending[filename] == 1:
+            del self._pending[filename]
+        else:
+            self._pending[filename] -= 1
+
+    @property
+    def current(self):
+        """filename -> hash (or list of hashes) of every output that is up to date."""
+        current = dict(self._kept)
+        for filename, digests in self._rows.items():
+            if filename not in self._pending:
+                current[filename] = digests[0] if len(digests) == 1 else digests
+        return current
+
+    def orphans(self):
+        """Files from the previous run whose store is no longer in the CSV."""
+        return sorted(set(self.previous) - set(self._rows))
+
+    def keep(self, filename):
+        # Keep tracking an orphan that was reported but not pruned
+        self._kept[filename] = self.previous[filename]
+
+    def save(self):
+        data = {"generator_version": GENERATOR_VERSION, "stores": self.current}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+# --- Output sinks ---
+class DirectorySink:
+    """Write each config as a file in an output folder."""
+
+    def __init__(self, output_dir=OUTPUT_DIR):
+        self.output_dir = output_dir
+        self.count = 0
+
+    def __enter__(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write(self, filename, config):
+        """Save one config and return where it was written."""
+        output_path = os.path.join(self.output_dir, filename)
+        with open(output_path, "w", encoding="utf-8") as out:
+            out.write(config)
+        self.count += 1
+        return output_path
+
+
+class ZipSink:
+    """Write each config straight into a ZIP archive, with no intermediate folder.
+
+    `target` is a path or binary file object. Without one the archive is
+    built in memory, or in a SpooledTemporaryFile that moves to disk beyond
+    `spool_max_size` bytes; read it back with getvalue() after closing.
+    A repeated filename replaces the earlier entry, as in the output folder;
+    the archive is rewritten once on close when that happens.
+    """
+
+    def __init__(self, target=None, spool_max_size=None):
+        if target is None:
+            target = tempfile.SpooledTemporaryFile(max_size=spool_max_size) if spool_max_size else io.BytesIO()
+        self.target = target
+        self.count = 0
+        self._zip = None
+        self._names = set()
+        self._replaced = {}
+
+    def __enter__(self):
+        self._zip = zipfile.ZipFile(self.target, "w", zipfile.ZIP_DEFLATED)
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self._zip.close()
+        if self._replaced and exc_type is None:
+            self._rewrite()
+        return False
+
+    def write(self, filename, config):
+        """Add one config as a ZIP entry and return its location."""
+        if filename in self._names:
+            self._replaced[filename] = config  # Later row wins
+        else:
+            self._zip.writestr(filename, config)
+            self._names.add(filename)
+            self.count += 1
+        if isinstance(self.target, (str, os.PathLike)):
+            return f"{self.target}:{filename}"
+        return filename
+
+    def _rewrite(self):
+        """Copy the archive with the replaced entries swapped for their latest config."""
+        def copy(source, target):
+            with zipfile.ZipFile(source) as src, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as dst:
+                for info in src.infolist():
+                    if info.filename in self._replaced:
+                        dst.writestr(info.filename, self._replaced[info.filename])
+                    else:
+                        dst.writestr(info, src.read(info))
+
+        if isinstance(self.target, (str, os.PathLike)):
+            temp_path = f"{self.target}.tmp"
+            copy(self.target, temp_path)
+            os.replace(temp_path, self.target)
+        else:
+            self.target.seek(0)
+            original = io.BytesIO(self.target.read())
+            self.target.seek(0)
+            self.target.truncate()
+            copy(original, self.target)
+
+    def getvalue(self):
+        """Return the finished archive bytes (in-memory or spooled targets)."""
+        self.target.seek(0)
+        return self.target.read()
+
+
+# --- Delta archives: each template once, per-store slot values ---
+class DeltaSink:
+    """Write a whole run as one compact delta archive instead of a file per store.
+
+    Each template's literal text is stored once and each store only keeps
+    its slot values, column by column, in gzipped JSON. write() takes the
+    (template name, slot values) pairs yielded by generate(..., delta=True);
+    `templates` maps a template name to (template text, is_flat_vlan,
+    vlan_profile), as TemplateSet.templates does. `target` is a path or a
+    binary file object; DeltaArchive reads the archive back.
+    """
+
+    def __init__(self, target, templates):
+        self.target = target
+        self.count = 0
+        self._segments = {name: compile_template(*template).segments() for name, template in templates.items()}
+        self._stores = {}  # filename -> (template name, slot values); a duplicate keeps its place, later row wins
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+        return False
+
+    def write(self, filename, config):
+        """Add one store's (template name, slot values) and return its location."""
+        if filename not in self._stores:
+            self.count += 1
+        self._stores[filename] = config
+        if isinstance(self.target, (str, os.PathLike)):
+            return f"{self.target}:{filename}"
+        return filename
+
+    def save(self):
+        names = list(self._segments)
+        index = {name: number for number, name in enumerate(names)}
+        rows = [[] for _ in names]
+        store_template = []
+        for name, values in self._stores.values():
+            store_template.append(index[name])
+            rows[index[name]].append(values)
+        templates = []
+        for name, template_rows in zip(names, rows):
+            literals, defaults = self._segments[name]
+            templates.append({"name": name, "literals": literals, "defaults": defaults,
+                              "columns": [[values[slot] for values in template_rows] for slot in range(len(defaults))]})
+        data = {"format": DELTA_FORMAT, "version": DELTA_FORMAT_VERSION, "generator_version": GENERATOR_VERSION,
+                "stores": list(self._stores), "store_template": store_template, "templates": templates}
+        payload = gzip.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                                DELTA_COMPRESS_LEVEL, mtime=0)
+        if isinstance(self.target, (str, os.PathLike)):
+            temp_path = f"{self.target}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(payload)
+            os.replace(temp_path, self.target)
+        else:
+            self.target.write(payload)
+
+
+class DeltaArchive:
+    """A DeltaSink archive, rebuilding store configs on demand."""
+
+    def __init__(self, data):
+        if data.get("format") != DELTA_FORMAT:
+            raise ValueError("❌ Not a Teldat delta archive.")
+        if data.get("version") != DELTA_FORMAT_VERSION:
+            raise ValueError(f"❌ Unsupported delta archive version {data.get('version')} "
+                             f"(expected {DELTA_FORMAT_VERSION}).")
+        self.generator_version = data.get("generator_version")
+        self.templates = data["templates"]
+        self.filenames = data["stores"]
+        self._positions = {}  # filename -> (template number, row in that template's columns)
+        counts = [0] * len(self.templates)
+        for filename, number in zip(self.filenames, data["store_template"]):
+            self._positions[filename] = (number, counts[number])
+            counts[number] += 1
+
+    @classmethod
+    def load(cls, source):
+        """Read an archive from a path, its bytes or a binary file object."""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                source = f.read()
+        elif not isinstance(source, (bytes, bytearray)):
+            source = source.read()
+        return cls(json.loads(gzip.decompress(source).decode("utf-8")))
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def find(self, store):
+        """Return the filename of a store given by name or filename, or None."""
+        for filename in (store, config_filename(store.replace(" ", "_"))):
+            if filename in self._positions:
+                return filename
+        return None
+
+    def __contains__(self, filename):
+        return filename in self._positions
+
+    def template_name(self, filename):
+        return self.templates[self._positions[filename][0]]["name"]
+
+    def delta(self, filename):
+        """Return the (template name, slot values) of one store, as DeltaSink received them."""
+        number, row = self._positions[filename]
+        template = self.templates[number]
+        return template["name"], [column[row] for column in template["columns"]]
+
+    def render(self, filename):
+        """Rebuild the config of one store."""
+        number, row = self._positions[filename]
+        template = self.templates[number]
+        return rebuild_config(template["literals"], template["defaults"],
+                              [column[row] for column in template["columns"]])
+
+    def items(self):
+        """Yield (filename, config) for every store, in the order they were generated."""
+        for filename in self.filenames:
+            yield filename, self.render(filename)
+
+
+# --- Sharded runs: one slice of the inventory per process or machine ---
+SHARD_FORMAT = "teldat-shard"  # Shard manifest marker (ShardManifest / merge_shards)
+SHARD_OUTPUT_KINDS = ("directory", "zip", "delta")
+
+
+def parse_shard(text):
+    """Return (index, count) from an "i/N" shard spec, with 1 <= i <= N."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        index = count = 0
+    if not 1 <= index <= count:
+        raise ValueError(f"❌ Invalid shard '{text}' (expected i/N with 1 <= i <= N, e.g. 1/4).")
+    return index, count
+
+
+def shard_of(store, count):
+    """Return the shard (1..count) of a store name.
+
+    It comes from the name's sha256, so shards are balanced, the same on
+    every machine and Python version, and a store only moves when the shard
+    count changes, never because rows were added or removed.
+    """
+    return int.from_bytes(hashlib.sha256(store.encode("utf-8")).digest()[:8], "big") % count + 1
+
+
+def config_digest(config):
+    """sha256 of a config text, or of a (template name, slot values) delta."""
+    if not isinstance(config, str):
+        config = json.dumps(list(config), ensure_ascii=False)
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ShardManifest:
+    """What one shard of a sharded run wrote, for merge_shards to check and assemble.
+
+    Holds the shard, the CSV's hash, what the configs were rendered with
+    (each template's hash, the reserve count and non-default VLAN profile
+    masks), the output, store / warning / error counts with the problem
+    messages, and a hash of every store's config.
+    `output` is (kind, path), kind one of SHARD_OUTPUT_KINDS; the path is
+    stored relative to the manifest, so shard results can be copied
+    together from several machines before merging.
+    """
+
+    def __init__(self, path, shard, csv_file, output, template_type, template_text,
+                 reserve_count=DEFAULT_RESERVE_COUNT, vlan_profile=None):
+        # template_text / vlan_profile: as for Manifest, per template name for a mixed batch
+        self.path = path
+        self.shard, self.shards = shard
+        self.csv = {"name": os.path.basename(csv_file), "sha256": file_sha256(csv_file)}
+        if isinstance(template_text, str):
+            template_text = {None: template_text}
+        if not isinstance(vlan_profile, dict):
+            vlan_profile = dict.fromkeys(template_text, vlan_profile)
+        self.templates = {name or "": hashlib.sha256(text.encode("utf-8")).hexdigest()
+                          for name, text in template_text.items()}
+        self.reserve_count = reserve_count
+        self.vlan_profiles = {}
+        for name in template_text:
+            profile = vlan_profile.get(name)
+            self.vlan_profiles[name or ""] = None if profile is None or profile.is_default else profile.masks
+        kind, output_path = output
+        self.output = {"kind": kind, "path": os.path.relpath(output_path, os.path.dirname(os.path.abspath(path)))}
+        self.template_type = template_type
+        self.stores = {}  # filename -> config digest; a duplicate keeps the later row's
+
+    def record(self, filename, config):
+        self.stores[filename] = config_digest(config)
+
+    def save(self, log):
+        data = {"format": SHARD_FORMAT, "generator_version": GENERATOR_VERSION,
+                "shard": self.shard, "shards": self.shards, "csv": self.csv,
+                "template_type": self.template_type, "templates": self.templates,
+                "reserve_count": self.reserve_count, "vlan_profiles": self.vlan_profiles, "output": self.output,
+                "counts": {"rows": log.stores, "stores": len(self.stores),
+                           "warnings": log.warnings, "errors": log.errors},
+                "problems": log.problems, "stores": self.stores}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+def load_shard_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get("format") != SHARD_FORMAT:
+        raise ValueError(f"❌ {path} is not a shard manifest.")
+    if data["output"]["kind"] not in SHARD_OUTPUT_KINDS:
+        raise ValueError(f"❌ {path}: unknown output kind '{data['output']['kind']}'.")
+    return data
+
+
+@contextlib.contextmanager
+def open_shard_output(manifest_path, output):
+    """Yield read(filename) -> (config as hashed, config text), or None when the store is missing."""
+    path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), output["path"])
+    if output["kind"] == "delta":
+        archive = DeltaArchive.load(path)
+
+        def read(filename):
+            if filename not in archive:
+                return None
+            return archive.delta(filename), archive.render(filename)
+        yield read
+    elif output["kind"] == "zip":
+        with zipfile.ZipFile(path) as archive:
+            names = set(archive.namelist())
+
+            def read(filename):
+                if filename not in names:
+                    return None
+                text = archive.read(filename).decode("utf-8")
+                return text, text
+            yield read
+    else:
+        def read(filename):
+            file_path = os.path.join(path, filename)
+            if not os.path.exists(file_path):
+                return None
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            return text, text
+        yield read
+
+
+SHARD_CONSISTENCY_FIELDS = ("shards", "generator_version", "template_type", "templates", "reserve_count",
+                            "vlan_profiles")
+MERGE_CHECKS = ("missing_shards", "duplicate_shards", "inconsistent", "collisions", "corrupt")
+
+
+def merge_shards(manifest_paths, sink, log=print):
+    """Check that shard manifests form one complete run, then write every store to `sink`.
+
+    The shards must all be present once and agree on the shard count, the
+    CSV (by hash), the generator version, the template type, the templates
+    (by hash), the reserve count and the VLAN profiles. A filename
+    written by two shards (a cross-shard hostname collision) is an error.
+    Nothing is written unless those checks pass; a store whose output no
+    longer matches its recorded hash is reported as corrupt and left out.
+    Returns the merge report.
+    """
+    shards = [(path, load_shard_manifest(path)) for path in manifest_paths]
+    if not shards:
+        raise ValueError("❌ No shard manifests given.")
+    first = shards[0][1]
+    count = first["shards"]
+
+    inconsistent = []
+    by_index = {}
+    owners = {}  # filename -> shards that wrote it
+    for path, data in shards:
+        expected = {field: first.get(field) for field in SHARD_CONSISTENCY_FIELDS}
+        expected["csv"] = first["csv"]["sha256"]
+        found = {field: data.get(field) for field in SHARD_CONSISTENCY_FIELDS}
+        found["csv"] = data["csv"]["sha256"]
+        for field in expected:
+            if found[field] != expected[field]:
+                inconsistent.append({"manifest": path, "field": field,
+                                     "value": found[field], "expected": expected[field]})
+        by_index.setdefault(data["shard"], []).append(path)
+        for filename in data["stores"]:
+            owners.setdefault(filename, []).append(data["shard"])
+
+    report = {
+        "shards": count,
+        "stores": {data["shard"]: len(data["stores"]) for _, data in shards},
+        "warnings": sum(data["counts"]["warnings"] for _, data in shards),
+        "errors": sum(data["counts"]["errors"] for _, data in shards),
+        "missing_shards": [index for index in range(1, count + 1) if index not in by_index],
+        "duplicate_shards": [{"shard": index, "manifests": paths} for index, paths in sorted(by_index.items())
+                             if len(paths) > 1],
+        "inconsistent": inconsistent,
+        "collisions": [{"file": filename, "shards": indexes} for filename, indexes in owners.items()
+                       if len(indexes) > 1],
+        "corrupt": [],
+        "problems": [f"[shard {data['shard']}] {problem}" for _, data in shards for problem in data["problems"]],
+        "written": 0,
+    }
+
+    for index in report["missing_shards"]:
+        log(f"❌ Shard {index}/{count} is missing")
+    for entry in report["duplicate_shards"]:
+        log(f"❌ Shard {entry['shard']}/{count} given more than once: {', '.join(entry['manifests'])}")
+    for entry in inconsistent:
+        log(f"❌ {entry['manifest']}: {entry['field']} is {entry['value']!r}, other shards have {entry['expected']!r}")
+    for entry in report["collisions"]:
+        log(f"❌ Hostname collision across shards: {entry['file']} written by shards "
+            f"{', '.join(map(str, entry['shards']))}")
+
+    if not any(report[key] for key in MERGE_CHECKS):
+        with sink:
+            for path, data in sorted(shards, key=lambda item: item[1]["shard"]):
+                with open_shard_output(path, data["output"]) as read:
+                    for filename, digest in data["stores"].items():
+                        found = read(filename)
+                        if found is None or config_digest(found[0]) != digest:
+                            report["corrupt"].append({"shard": data["shard"], "file": filename,
+                                                      "reason": "missing" if found is None else "hash mismatch"})
+                            log(f"❌ Shard {data['shard']}: {filename} is "
+                                f"{'missing' if found is None else 'changed since it was generated'}")
+                            continue
+                        sink.write(filename, found[1])
+                        report["written"] += 1
+
+    report["problem_count"] = sum(len(report[key]) for key in MERGE_CHECKS)
+    report["valid"] = report["problem_count"] == 0
+    return report
+
+
+def format_merge(report):
+    return (f"🧩 Merge: {report['written']} store(s) from {len(report['stores'])}/{report['shards']} shard(s), "
+            + ", ".join(f"{len(report[key])} {key.replace('_', ' ')}" for key in MERGE_CHECKS))
+
+
+# --- Inventory validation (pre-pass) ---
+IPV6_OFFSET = 1 << 32  # IPv6 intervals sort after every IPv4 address
+
+
+def _network_bounds(ip, mask):
+    """Return (first, last, prefix length) of the subnet of `ip`/`mask` as integers.
+
+    Dotted-quad IPv4 is parsed directly; anything else goes through
+    ipaddress, which raises ValueError for what the generator would reject.
+    """
+    value = _ipv4_int(ip)
+    if value is not None:
+        prefix, hostmask = _mask_bits(mask)
+        return value & ~hostmask, value | hostmask, prefix
+    network = ipaddress.ip_network(f"{ip}/{mask}", strict=False)
+    offset = IPV6_OFFSET if network.version == 6 else 0
+    return int(network.network_address) + offset, int(network.broadcast_address) + offset, network.prefixlen
+
+
+@functools.lru_cache(maxsize=NETWORK_INFO_CACHE_SIZE)
+def _format_subnet(first, prefix):
+    if first >= IPV6_OFFSET:
+        return f"{ipaddress.IPv6Address(first - IPV6_OFFSET)}/{prefix}"
+    return f"{ipaddress.IPv4Address(first)}/{prefix}"
+
+
+def row_subnets(columns, values, is_flat_vlan, vlan_profile=None):
+    """Yield (field, ip, mask) for every subnet a CSV row assigns, like SiteRecord reads them.
+
+    `columns` is the file's SiteColumns and `values` the row's values.
+    is_flat_vlan=None (mixed-template inventory) reads the columns of both types.
+    """
+    field = columns.field
+    if is_flat_vlan is not False:
+        lan = columns.lan(values)
+        if lan:
+            yield lan[0], lan[1], lan[3]
+        if is_flat_vlan:
+            return
+    vlans = {key: field(values, position) for key, position in columns.vlans}
+    for csv_key, _, mask, vlan_ip, _ in (vlan_profile or DEFAULT_VLAN_PROFILE).populated(vlans):
+        yield csv_key, vlan_ip, mask
+    vrf_ip, vrf_mask = field(values, columns.vrf_ip), field(values, columns.vrf_mask)
+    if vrf_ip and vrf_mask:
+        yield "VRF_Branch_IP", vrf_ip, vrf_mask
+
+
+def _subnet_conflicts(a, b):
+    # A store's VRF branch route may summarise its own LAN subnets
+    return a[2] != b[2] or "VRF_Branch_IP" not in (a[3], b[3])
+
+
+def validate_inventory(csv_source, is_flat_vlan=None, log=print, vlan_profile=None):
+    """Check the whole inventory before anything is generated.
+
+    Finds duplicate hostnames, duplicate Tnip1/Tnip2 addresses, subnets that
+    overlap across stores (or between VLANs of one store) and addresses that
+    do not parse. Subnets are checked with a sort-and-sweep over integer
+    intervals, O(n log n) in the number of subnets; each overlapping subnet
+    is reported against the LAN/VLAN subnet or the VRF route reaching
+    furthest before it. The two are tracked apart, so a store's VRF summary
+    route cannot hide overlaps between the subnets inside it. VLAN masks
+    come from `vlan_profile` (default: VLAN_MASK_MAP). Rows are numbered
+    from 1 in CSV order. Returns a JSON-serialisable report.
+    """
+    stores = []
+    hostnames = {}
+    tunnels = {"Tnip1": {}, "Tnip2": {}}
+    intervals = []  # (first, last, row, field, prefix length)
+    invalid = []
+
+    rows = iter_csv_values(csv_source, lambda message: None)
+    columns = SiteColumns(next(rows))
+    positions = {"Tnip1": columns.tnip1, "Tnip2": columns.tnip2}
+    for _, values in rows:
+        number = len(stores) + 1
+        if columns.store is None:
+            raise KeyError("❌ CSV must have a 'StoreName' or similar column.")
+        store = columns.field(values, columns.store)
+        stores.append(store)
+        hostnames.setdefault(store.replace(" ", "_"), []).append(number)
+        for column, seen in tunnels.items():
+            value = columns.field(values, positions[column])
+            if value:
+                seen.setdefault(value, []).append(number)
+        for field, ip, mask in row_subnets(columns, values, is_flat_vlan, vlan_profile):
+            try:
+                first, last, prefix = _network_bounds(ip, mask)
+            except ValueError as e:
+                invalid.append({"row": number, "store": store, "field": field, "value": f"{ip} {mask}",
+                                "error": str(e)})
+                continue
+            intervals.append((first, last, number, field, prefix))
+
+    def subnet_entry(interval):
+        return {"row": interval[2], "store": stores[interval[2] - 1], "field": interval[3],
+                "subnet": _format_subnet(interval[0], interval[4])}
+
+    # --- Sort and sweep: keep the LAN/VLAN subnet and the VRF route that reach furthest so far ---
+    overlaps = []
+    intervals.sort(key=lambda interval: (interval[0], -interval[1]))
+    reach = {False: None, True: None}  # is VRF route -> furthest-reaching interval
+    for interval in intervals:
+        for other in reach.values():
+            if other is not None and interval[0] <= other[1] and _subnet_conflicts(interval, other):
+                overlaps.append(dict(subnet_entry(interval), conflicts_with=subnet_entry(other),
+                                     duplicate=interval[:2] == other[:2]))
+                break
+        is_vrf = interval[3] == "VRF_Branch_IP"
+        if reach[is_vrf] is None or interval[1] > reach[is_vrf][1]:
+            reach[is_vrf] = interval
+
+    report = {
+        "rows": len(stores),
+        "subnets": len(intervals),
+        "duplicate_hostnames": [{"hostname": hostname, "rows": rows}
+                                for hostname, rows in hostnames.items() if len(rows) > 1],
+        "duplicate_tunnel_ips": [{"column": column, "ip": ip, "rows": rows,
+                                  "stores": [stores[number - 1] for number in rows]}
+                                 for column, seen in tunnels.items()
+                                 for ip, rows in seen.items() if len(rows) > 1],
+        "overlapping_subnets": overlaps,
+        "invalid_addresses": invalid,
+    }
+    report["problems"] = sum(len(report[key]) for key in VALIDATION_CHECKS)
+    report["valid"] = report["problems"] == 0
+
+    for entry in report["duplicate_hostnames"]:
+        log(f"⚠️  Duplicate hostname '{entry['hostname']}' on rows {', '.join(map(str, entry['rows']))}")
+    for entry in report["duplicate_tunnel_ips"]:
+        log(f"⚠️  Duplicate {entry['column']} {entry['ip']}: {', '.join(entry['stores'])}")
+    for entry in overlaps:
+        other = entry["conflicts_with"]
+        log(f"⚠️  {entry['store']} {entry['field']} {entry['subnet']} overlaps "
+            f"{other['store']} {other['field']} {other['subnet']}")
+    for entry in invalid:
+        log(f"❌ {entry['store']} (row {entry['row']}) {entry['field']}: invalid address '{entry['value']}'")
+    return report
+
+
+VALIDATION_CHECKS = ("duplicate_hostnames", "duplicate_tunnel_ips", "overlapping_subnets", "invalid_addresses")
+
+
+def format_validation(report):
+    return (f"🔎 Validation: {report['rows']} row(s), "
+            + ", ".join(f"{len(report[key])} {key.replace('_', ' ')}" for key in VALIDATION_CHECKS))
+
+
+# --- Subnet allocation (fill missing addresses from supernet pools) ---
+class SubnetAllocator:
+    """Buddy allocator of IPv4 subnets inside one or more supernets.
+
+    Free space is a set of aligned blocks per prefix length (with a heap
+    for the lowest address). A /p request takes the lowest free /p block,
+    or splits the smallest larger block that is free, so every allocation
+    costs O(32 log n) whatever the pool size. reserve() carves subnets that
+    are already in use out of the free blocks.
+    """
+
+    def __init__(self, supernets):
+        self.supernets = []
+        self._free = [set() for _ in range(33)]  # prefix length -> free block addresses
+        self._heaps = [[] for _ in range(33)]
+        self._split = [set() for _ in range(33)]  # blocks divided into two halves
+        for supernet in supernets:
+            try:
+                network = ipaddress.IPv4Network(supernet)
+            except ValueError as e:
+                raise ValueError(f"❌ Invalid supernet '{supernet}': {e}") from None
+            self.supernets.append(network)
+            self._add(network.prefixlen, int(network.network_address))
+
+    def _add(self, prefix, block):
+        self._free[prefix].add(block)
+        heapq.heappush(self._heaps[prefix], block)
+
+    def _lowest(self, prefix):
+        heap, free = self._heaps[prefix], self._free[prefix]
+        while heap and heap[0] not in free:
+            heapq.heappop(heap)  # Reserved since it was pushed
+        return heap[0] if heap else None
+
+    def _divide(self, prefix, block):
+        self._free[prefix].discard(block)
+        self._split[prefix].add(block)
+        self._add(prefix + 1, block)
+        self._add(prefix + 1, block + (1 << (31 - prefix)))
+
+    def allocate(self, prefix):
+        """Return the first address of a free /prefix block, or None when the pools are full."""
+        source = prefix
+        while source >= 0 and self._lowest(source) is None:
+            source -= 1
+        if source < 0:
+            return None
+        block = self._lowest(source)
+        while source < prefix:
+            self._divide(source, block)
+            source += 1
+        self._free[prefix].discard(block)
+        return block
+
+    def reserve(self, first, last):
+        """Mark the addresses first..last (integers) as used."""
+        for network in self.supernets:
+            self._reserve(network.prefixlen, int(network.network_address), first, last)
+
+    def _reserve(self, prefix, block, first, last):
+        block_last = block + (1 << (32 - prefix)) - 1
+        if block_last < first or block > last:
+            return
+        if block in self._free[prefix]:
+            if first <= block and block_last <= last:
+                self._free[prefix].discard(block)
+                return
+            self._divide(prefix, block)
+        elif block not in self._split[prefix]:
+            return  # Allocated or reserved as a whole
+        half = 1 << (31 - prefix)
+        self._reserve(prefix + 1, block, first, last)
+        self._reserve(prefix + 1, block + half, first, last)
+
+
+def _first_host(block, prefix):
+    """The address given to the router (BVI) of an allocated subnet: the first usable one."""
+    return _format_ipv4(block + 1 if prefix < 31 else block)
+
+
+def allocate_inventory(csv_source, supernets, output, *, is_flat_vlan=False, vlan_profile=None,
+                       template_set=None, mapping=None, log=print):
+    """Fill the missing BVI/LAN and VLAN addresses of an inventory from `supernets`.
+
+    Every subnet the inventory already uses (LANs, VLANs, VRF routes and
+    tunnel addresses) is reserved first; then each row gets a free subnet
+    for every empty VLAN column of its VLAN profile (the profile's mask) or,
+    for FlatVlan rows, for an empty BVI_IP / LAN_IP (its mask column, or
+    DEFAULT_LAN_MASK). The router address (first usable IP) is written in.
+    With a TemplateSet, each row's type and profile come from its template.
+    `csv_source` is read twice, so it must be a path or bytes. The completed
+    CSV, with the input's delimiter, goes to `output` (a path or text file).
+    Multiple-space separated inventories are refused: a row with empty
+    address columns cannot be split back into its columns.
+    Returns {"rows", "stores", "allocated", "exhausted"}.
+    """
+    with open_csv_source(csv_source) as csvfile:
+        first_line = next((line.strip() for line in csvfile if line.strip()), "")
+    delimiter = detect_delimiter(first_line)[0]
+    if not delimiter:
+        raise ValueError("❌ Allocation needs a comma or tab separated CSV: rows with empty address "
+                         "columns cannot be read from a multiple-space separated inventory.")
+
+    profiles = [vlan_profile or DEFAULT_VLAN_PROFILE]
+    if template_set is not None:
+        profiles = [profile or DEFAULT_VLAN_PROFILE for profile in template_set.vlan_profiles().values()]
+    used_profile = merge_vlan_profiles(profiles)
+    allocator = SubnetAllocator(supernets)
+
+    # --- Pass 1: reserve everything already assigned ---
+    rows = iter_csv_values(csv_source, lambda message: None)
+    columns = SiteColumns(next(rows))
+    for _, values in rows:
+        addresses = [(ip, mask) for _, ip, mask in row_subnets(columns, values, None, used_profile)]
+        addresses += [(columns.field(values, position), "32") for position in (columns.tnip1, columns.tnip2)]
+        for ip, mask in addresses:
+            if not ip:
+                continue
+            try:
+                first, last, _ = _network_bounds(ip, mask)
+            except ValueError:
+                continue  # Reported by validation / generation
+            if last < IPV6_OFFSET:
+                allocator.reserve(first, last)
+
+    # --- Pass 2: fill the gaps, row by row ---
+    report = {"rows": 0, "stores": 0, "allocated": 0, "exhausted": 0}
+    with contextlib.ExitStack() as stack:
+        if isinstance(output, (str, os.PathLike)):
+            output = stack.enter_context(open(output, "w", newline="", encoding="utf-8"))
+        write = csv.writer(output, delimiter=delimiter).writerow
+        rows = iter_csv_values(csv_source, lambda message: None)
+        write(next(rows))
+        for _, values in rows:
+            report["rows"] += 1
+            values = values + [""] * (len(columns.header) - len(values))
+            filled = _allocate_row(allocator, columns, values, is_flat_vlan, vlan_profile, template_set,
+                                   mapping or {}, log, report)
+            report["stores"] += bool(filled)
+            write(values)
+    return report
+
+
+def _allocate_row(allocator, columns, values, is_flat_vlan, vlan_profile, template_set, mapping, log, report):
+    """Fill one row's empty address columns in place; returns the number filled."""
+    field = columns.field
+    store = field(values, columns.store) if columns.store is not None else ""
+    if template_set is not None:
+        name = template_set.resolve(field(values, columns.template) or mapping.get(store, ""))
+        if name is None:
+            return 0  # Reported when the batch is generated
+        _, is_flat_vlan, vlan_profile = template_set.templates[name]
+
+    wanted = []  # (column position, column name, mask, mask position to fill)
+    if is_flat_vlan:
+        if not columns.lan(values):
+            ip_position, ip_name, mask_position = ((columns.bvi_ip, "BVI_IP", columns.bvi_mask)
+                                                   if columns.bvi_ip is not None
+                                                   else (columns.lan_ip, "LAN_IP", columns.lan_mask))
+            if ip_position is not None:
+                mask = field(values, mask_position) if mask_position is not None else ""
+                wanted.append((ip_position, ip_name, mask or DEFAULT_LAN_MASK, None if mask else mask_position))
+    else:
+        profile = vlan_profile or DEFAULT_VLAN_PROFILE
+        for key, position in columns.vlans:
+            if key in profile.columns and not field(values, position):
+                wanted.append((position, key, profile.columns[key][2], None))
+
+    filled = 0
+    for position, name, mask, mask_position in wanted:
+        try:
+            prefix = _mask_bits(mask)[0]
+        except ValueError:
+            log(f"❌ {store}: invalid mask '{mask}' for {name} - not allocated")
+            continue
+        block = allocator.allocate(prefix)
+        if block is None:
+            report["exhausted"] += 1
+            log(f"❌ {store}: no free /{prefix} left in the supernet pool for {name}")
+            continue
+        values[position] = _first_host(block, prefix)
+        if mask_position is not None:
+            values[mask_position] = mask
+        report["allocated"] += 1
+        filled += 1
+        log(f"   🧮 {store}: {name} = {values[position]} ({_format_ipv4(block)}/{prefix})")
+    return filled
+
+
+def format_allocation(report, output):
+    return (f"🧮 Allocation: {report['allocated']} subnet(s) for {report['stores']} store(s) "
+            f"of {report['rows']} row(s), written to {output}")
+
+
+# --- Mixed-template batches ---
+TEMPLATE_COLUMN = "Template"  # CSV column naming a row's template
+
+
+class TemplateSet:
+    """The templates of a mixed batch, loaded and analysed once up front.
+
+    Rows refer to a template by file name, with or without its extension
+    (case-insensitive). `stats` holds per-template store, warning and error
+    counts for the run.
+    """
+
+    def __init__(self):
+        self.templates = {}  # name -> (template text, is_flat_vlan, vlan_profile)
+        self.stats = {}
+        self._names = {}
+
+    def add(self, name, template_text, is_flat_vlan, vlan_profile=None):
+        if is_flat_vlan or vlan_profile == DEFAULT_VLAN_PROFILE:
+            vlan_profile = None
+        self.templates[name] = (template_text, is_flat_vlan, vlan_profile)
+        self.stats[name] = {"type": "FlatVlan" if is_flat_vlan else "InterVlan",
+                            "stores": 0, "warnings": 0, "errors": 0}
+        for alias in (name, os.path.splitext(name)[0]):
+            self._names.setdefault(alias.lower(), name)
+        compile_template(template_text, is_flat_vlan, vlan_profile)
+
+    def load(self, name, template_text, log=print, vlan_profile=None):
+        """Detect the template's type, log it and add the template."""
+        is_flat_vlan, detection_method = detect_template_type(name, "", template_text)
+        log(f"✅ Using template: {name}")
+        if not is_flat_vlan and vlan_profile not in (None, DEFAULT_VLAN_PROFILE):
+            log(f"🧩 VLAN profile: {vlan_profile.name} ({len(vlan_profile.masks)} VLANs)")
+        log_detection(name, "", is_flat_vlan, detection_method, log)
+        self.add(name, template_text, is_flat_vlan, vlan_profile)
+
+    @classmethod
+    def from_files(cls, paths, log=print, vlan_profiles=None, vlan_profile=None):
+        """Load and analyse every template file, logging each detection.
+
+        Each template uses `vlan_profile` when given, else its profile in
+        `vlan_profiles` (a VlanProfiles), else the default VLAN masks.
+        """
+        template_set = cls()
+        for path in paths:
+            name = os.path.basename(path)
+            profile = vlan_profile or (vlan_profiles.for_template(name) if vlan_profiles else None)
+            with open(path, "r", encoding="utf-8") as f:
+                template_set.load(name, f.read(), log, profile)
+        return template_set
+
+    def vlan_profiles(self):
+        """{template name: VlanProfile or None} of the loaded templates."""
+        return {name: vlan_profile for name, (_, _, vlan_profile) in self.templates.items()}
+
+    def resolve(self, reference):
+        """Return the template name `reference` refers to, or None."""
+        return self._names.get(reference.strip().lower())
+
+    def assign(self, rows, mapping=None, log=print):
+        """Yield (template name, SiteRecord) pairs; rows without a known template are skipped."""
+        mapping = mapping or {}
+        for row in rows:
+            store = row.store
+            reference = row.template or mapping.get(store, "")
+            name = self.resolve(reference) if reference else None
+            if name is None:
+                if reference:
+                    log(f"❌ {store}: unknown template '{reference}' - store skipped")
+                else:
+                    log(f"❌ {store}: no '{TEMPLATE_COLUMN}' value or mapping entry - store skipped")
+                continue
+            yield name, row
+
+    def record(self, name, lines):
+        stats = self.stats[name]
+        stats["stores"] += 1
+        for line in lines:
+            severity = message_severity(line)
+            if severity:
+                stats[f"{severity}s"] += 1
+
+    def type_names(self):
+        return " + ".join(sorted({stats["type"] for stats in self.stats.values()}))
+
+    def format_stats(self):
+        return "\n".join(f"   📄 {name} ({stats['type']}): {stats['stores']} store(s), "
+                         f"{stats['warnings']} warning(s), {stats['errors']} error(s)"
+                         for name, stats in self.stats.items())
+
+
+def load_template_map(path):
+    """Read a store -> template mapping file: a comma or tab separated CSV
+    with a store column and a "Template" column."""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter="\t" if "\t" in header else ",")
+        if not reader.fieldnames or TEMPLATE_COLUMN not in [name.strip() for name in reader.fieldnames]:
+            raise KeyError(f"❌ Template map {path} must have a '{TEMPLATE_COLUMN}' column.")
+        mapping = {}
+        for row in reader:
+            row = {(k or "").strip(): (v or "").strip() for k, v in row.items()}
+            mapping[row[find_store_key(row)]] = row[TEMPLATE_COLUMN]
+        return mapping
+
+
+# --- Generation API ---
+TEMPLATE_TYPES = ("FlatVlan", "InterVlan")
+
+
+def config_filename(safe_hostname):
+    return f"{safe_hostname}_TELDAT_CONFIG.txt"
+
+
+def decode_template(data):
+    """Decode uploaded template bytes with universal newlines, as the CLI reads a template file."""
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").read()
+
+
+def log_detection(template_file, csv_file, is_flat_vlan, detection_method, log=print):
+    """Log the detected template type and warn when the CSV name disagrees.
+
+    `log` is a callable; a GenerationLog logs these lines at summary level.
+    """
+    if isinstance(log, GenerationLog):
+        log = log.info
+    template_type = "FlatVlan" if is_flat_vlan else "InterVlan"
+    log(f"🔍 Detection: {detection_method}")
+    log(f"📋 Template type: {template_type}")
+
+    # Validate CSV naming matches template type
+    csv_lower = csv_file.lower()
+    if is_flat_vlan and ("intervlan" in csv_lower or "inter_vlan" in csv_lower):
+        log(f"⚠️  WARNING: Using FlatVlan template but CSV name suggests InterVlan: {csv_file}")
+    elif not is_flat_vlan and ("flatvlan" in csv_lower or "flat_vlan" in csv_lower):
+        log(f"⚠️  WARNING: Using InterVlan template but CSV name suggests FlatVlan: {csv_file}")
+
+    log("")  # Empty line for readability
+
+
+def generate(template_text, csv_source, *, template_type=None, reserve_count=DEFAULT_RESERVE_COUNT,
+             workers=1, chunk_size=DEFAULT_CHUNK_SIZE, manifest=None, log=print, timer=None, vlan_profile=None,
+             delta=False, shard=None, stores=None):
+    """Yield (filename, config) for every store in `csv_source`.
+
+    `csv_source` is a CSV path, the CSV bytes or a file object. `template_type`
+    is "FlatVlan" or "InterVlan"; None detects it from the template content.
+    Progress messages go to `log`, a GenerationLog or any callable taking a
+    line. Rows are read, rendered and yielded one at a time (or in chunks
+    across `workers` processes), in CSV order.
+
+    Two stores with the same safe hostname share a filename: a warning is
+    logged and both are yielded in CSV order, so the later row wins.
+
+    With a Manifest, rows unchanged since the previous run are not rendered;
+    call manifest.mark_written(filename) once each yielded config is saved.
+    An Instrumentation `timer` collects per-phase timings of the run.
+    `vlan_profile` (a VlanProfile) sets the VLANs and masks of an InterVlan
+    template; None uses VLAN_MASK_MAP.
+    With delta=True each config is yielded as (template name, slot values)
+    for a DeltaSink instead of as text. `shard` (index, count) limits the run
+    to the stores of one shard (see shard_of). `stores` (names) limits it to
+    those stores, whose rows are found through the CSV's RowIndex; the CSV
+    must then be a path.
+    """
+    if template_type is None:
+        is_flat_vlan, _ = detect_template_type("", "", template_text)
+    elif template_type in TEMPLATE_TYPES:
+        is_flat_vlan = template_type == "FlatVlan"
+    else:
+        raise ValueError(f"❌ Unknown template type '{template_type}' (expected one of {', '.join(TEMPLATE_TYPES)}).")
+
+    yield from _generate({None: (template_text, is_flat_vlan, None if is_flat_vlan else vlan_profile)}, csv_source,
+                         lambda rows, row_log: ((None, row) for row in rows),
+                         reserve_count, workers, chunk_size, manifest, log, timer,
+                         delta=delta, shard=shard, stores=stores)
+
+
+def generate_mixed(template_set, csv_source, *, mapping=None, reserve_count=DEFAULT_RESERVE_COUNT,
+                   workers=1, chunk_size=DEFAULT_CHUNK_SIZE, manifest=None, log=print, timer=None, delta=False,
+                   shard=None, stores=None):
+    """Yield (filename, config) for an inventory whose rows use different templates.
+
+    Each row is routed to a template of `template_set` by its "Template"
+    column or, when that is empty, by `mapping` (store name -> template).
+    All templates are analysed once and the whole inventory is rendered in
+    a single streaming pass; per-template counts go to template_set.stats.
+    Each template keeps the VLAN profile it was added with.
+    Other arguments are as for generate().
+    """
+    yield from _generate(template_set.templates, csv_source,
+                         lambda rows, row_log: template_set.assign(rows, mapping, row_log),
+                         reserve_count, workers, chunk_size, manifest, log, timer, template_set, delta, shard,
+                         stores)
+
+
+def _generate(templates, csv_source, route, reserve_count, workers, chunk_size, manifest, log, timer,
+              template_set=None, delta=False, shard=None, stores=None):
+    if not isinstance(log, GenerationLog):
+        log = GenerationLog(write=log)
+
+    timer = timer or NO_INSTRUMENTATION
+
+    def read_rows(row_log):
+        if stores is not None:
+            records = iter_store_records(csv_source, stores, row_log)
+        else:
+            records = iter_site_records(csv_source, row_log, timer, shard)
+        rows = route(records, row_log)
+        if manifest is not None:
+            rows = manifest.changed_rows(rows)
+        return timer.timed("csv_read", rows)
+
+    if workers > 1:
+        rendered = iter_rendered_parallel(templates, read_rows, workers, chunk_size,
+                                          reserve_count, log.verbose, timer, delta)
+    else:
+        rendered = iter_rendered_serial(templates, read_rows, log, reserve_count, timer, delta, log.verbose)
+
+    seen = set()
+    for name, safe_hostname, config, lines in rendered:
+        if config is None:
+            # Reader messages forwarded from a worker chunk
+            for line in lines:
+                log(line)
+            continue
+        filename = config_filename(safe_hostname)
+        if filename in seen:
+            lines.append(f"⚠️  WARNING: Duplicate hostname '{safe_hostname}' - {filename} is overwritten by a later row")
+        seen.add(filename)
+        if template_set is not None:
+            template_set.record(name, lines)
+        log.store(safe_hostname, filename, lines)
+        yield filename, (name, config) if delta else config
+
+
+# --- Command line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Teldat router configs from a template and a CSV of stores.")
+    parser.add_argument("--template", help="Template file (default: auto-detect in the current directory)")
+    parser.add_argument("--templates", nargs="+", metavar="FILE",
+                        help=f"Mixed batch: several template files; each row picks one by its "
+                             f"'{TEMPLATE_COLUMN}' column or through --template-map")
+    parser.add_argument("--template-map", metavar="PATH",
+                        help=f"CSV mapping store names to templates ('{TEMPLATE_COLUMN}' column), for --templates")
+    parser.add_argument("--vlan-profiles", metavar="PATH",
+                        help="JSON file of named VLAN -> mask profiles and the profile each template uses")
+    parser.add_argument("--vlan-profile", metavar="NAME",
+                        help=f"VLAN profile for every InterVlan template (default: per template from "
+                             f"--vlan-profiles, else '{DEFAULT_VLAN_PROFILE_NAME}')")
+    parser.add_argument("--csv", help="CSV file (default: auto-detect in the current directory)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR,
+                        help=f"Folder the configs are written to (default: {OUTPUT_DIR})")
+    parser.add_argument("--zip", metavar="PATH",
+                        help="Write the configs as entries of this ZIP archive instead of a folder")
+    parser.add_argument("--delta", metavar="PATH",
+                        help="Write one compact delta archive (each template once plus per-store values) "
+                             "instead of a folder; expand it with teldat_delta.py")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Only generate shard I of N (stores split by a stable hash of their name) and "
+                             "write a shard manifest for teldat_merge.py")
+    parser.add_argument("--store", nargs="+", metavar="NAME",
+                        help=f"Only generate these stores, reading just their rows through an index of the CSV "
+                             f"(kept as <csv>{ROW_INDEX_SUFFIX}, rebuilt when the CSV changes)")
+    parser.add_argument("--store-list", metavar="PATH",
+                        help="File with one store name per line to generate, as for --store")
+    parser.add_argument("--reserve-count", type=int, default=DEFAULT_RESERVE_COUNT,
+                        help=f"Usable IPs reserved at the end of each DHCP range (default: {DEFAULT_RESERVE_COUNT})")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Skip stores unchanged since the last run (tracked in <output-dir>/{MANIFEST_FILE})")
+    parser.add_argument("--prune", action="store_true",
+                        help="With --incremental, delete outputs of stores no longer in the CSV")
+    levels = parser.add_mutually_exclusive_group()
+    levels.add_argument("--quiet", dest="log_level", action="store_const", const=LOG_QUIET,
+                        help="Only print warnings, errors and the final summary")
+    levels.add_argument("--summary", dest="log_level", action="store_const", const=LOG_SUMMARY,
+                        help="Print one line per store plus warnings and errors")
+    levels.add_argument("--verbose", dest="log_level", action="store_const", const=LOG_VERBOSE,
+                        help="Print every processing step (default)")
+    parser.set_defaults(log_level=LOG_VERBOSE)
+    parser.add_argument("--events", metavar="PATH",
+                        help="Write a JSON-lines event log (one record per store) to PATH")
+    parser.add_argument("--validate", action="store_true",
+                        help="Check the whole inventory for duplicate stores, tunnel IPs and overlapping "
+                             "subnets before generating")
+    parser.add_argument("--validation-report", metavar="PATH",
+                        help="Write the validation report as JSON to PATH (implies --validate)")
+    parser.add_argument("--validate-only", action="store_true",
+                        help="Only run the validation pre-pass; exit with status 1 if it finds problems")
+    parser.add_argument("--allocate", nargs="+", metavar="SUPERNET",
+                        help="Fill empty BVI_IP/LAN_IP and VLAN columns with free subnets from these supernets "
+                             "(e.g. 10.20.0.0/16), then generate from the completed CSV")
+    parser.add_argument("--allocated-csv", metavar="PATH",
+                        help="Where --allocate writes the completed CSV (default: <csv>_allocated.csv)")
+    parser.add_argument("--allocate-only", action="store_true",
+                        help="With --allocate, only write the completed CSV")
+    parser.add_argument("--timing", action="store_true",
+                        help="Print a per-phase timing report with the slowest stores")
+    parser.add_argument("--timing-json", metavar="PATH", help="Write the timing report as JSON to PATH")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N,
+                        help=f"Slowest stores listed in the timing report (default: {DEFAULT_TOP_N})")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                        help="Run the generation under cProfile or tracemalloc")
+    parser.add_argument("--profile-output", metavar="PATH",
+                        help="Write the profile (cProfile stats file / tracemalloc text) to PATH instead of stdout")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes used to render configs (default: 1, serial)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Rows sent to a worker at a time (default: {DEFAULT_CHUNK_SIZE})")
+    args = parser.parse_args(argv)
+    if args.zip and args.incremental:
+        parser.error("--incremental tracks files in --output-dir and cannot be combined with --zip")
+    if args.delta and (args.zip or args.incremental):
+        parser.error("--delta cannot be combined with --zip or --incremental")
+    if (args.store or args.store_list) and (args.incremental or args.shard):
+        parser.error("--store and --store-list cannot be combined with --incremental or --shard")
+    if args.shard:
+        if args.incremental:
+            parser.error("--shard cannot be combined with --incremental")
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.templates and args.template:
+        parser.error("use either --template or --templates")
+    if args.templates and not args.csv:
+        parser.error("--templates needs --csv")
+    if args.template_map and not args.templates:
+        parser.error("--template-map needs --templates")
+    if (args.allocated_csv or args.allocate_only) and not args.allocate:
+        parser.error("--allocated-csv and --allocate-only need --allocate")
+    if args.vlan_profile and args.vlan_profile != DEFAULT_VLAN_PROFILE_NAME and not args.vlan_profiles:
+        parser.error("--vlan-profile needs --vlan-profiles")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    if args.profile:
+        run_profiled(args.profile, lambda: run(args), args.profile_output)
+    else:
+        run(args)
+
+
+def run(args):
+    """Generate the configs described by the parsed command-line `args`."""
+    timer = Instrumentation(args.top) if (args.timing or args.timing_json) else NO_INSTRUMENTATION
+
+    template_file, csv_file = args.template, args.csv
+    if not args.templates and not (template_file and csv_file):
+        found_template, found_csv = find_input_files()
+        template_file = template_file or found_template
+        csv_file = csv_file or found_csv
+
+    vlan_profiles = VlanProfiles.load(args.vlan_profiles) if args.vlan_profiles else VlanProfiles()
+    vlan_profile = vlan_profiles.get(args.vlan_profile) if args.vlan_profile else None
+
+    events = open(args.events, "w", encoding="utf-8") if args.events else None
+    log = GenerationLog(args.log_level, events=events)
+
+    template_set = None
+    if args.templates:
+        # --- Mixed batch: load and analyse every template once ---
+        with timer.phase("detect"):
+            template_set = TemplateSet.from_files(args.templates, log.info, vlan_profiles, vlan_profile)
+        log.info(f"✅ Using CSV: {csv_file}")
+        mapping = load_template_map(args.template_map) if args.template_map else None
+        is_flat_vlan = None
+        template = {name: text for name, (text, _, _) in template_set.templates.items()}
+        vlan_profile = template_set.vlan_profiles()
+        validation_profile = merge_vlan_profiles(profile or DEFAULT_VLAN_PROFILE for profile in vlan_profile.values())
+        template_type = template_set.type_names()
+    else:
+        log.info(f"✅ Using template: {template_file}")
+        log.info(f"✅ Using CSV: {csv_file}")
+
+        # --- Load the template ---
+        with open(template_file, "r", encoding="utf-8") as f:
+            template = f.read()
+
+        with timer.phase("detect"):
+            is_flat_vlan, detection_method = detect_template_type(os.path.basename(template_file),
+                                                                  os.path.basename(csv_file), template)
+        log_detection(template_file, csv_file, is_flat_vlan, detection_method, log)
+        template_type = "FlatVlan" if is_flat_vlan else "InterVlan"
+        if is_flat_vlan:
+            vlan_profile = None
+        else:
+            vlan_profile = vlan_profile or vlan_profiles.for_template(template_file)
+            if vlan_profile == DEFAULT_VLAN_PROFILE:
+                vlan_profile = None
+            else:
+                log.info(f"🧩 VLAN profile: {vlan_profile.name} ({len(vlan_profile.masks)} VLANs)")
+        validation_profile = vlan_profile
+
+    # --- Fill missing subnets from the supernet pools, then work from the completed CSV ---
+    if args.allocate:
+        allocated_csv = args.allocated_csv or f"{os.path.splitext(csv_file)[0]}_allocated.csv"
+        with timer.phase("allocate"):
+            if template_set is not None:
+                allocation = allocate_inventory(csv_file, args.allocate, allocated_csv, template_set=template_set,
+                                                mapping=mapping, log=log)
+            else:
+                allocation = allocate_inventory(csv_file, args.allocate, allocated_csv, is_flat_vlan=is_flat_vlan,
+                                                vlan_profile=vlan_profile, log=log)
+        log.info(format_allocation(allocation, allocated_csv))
+        csv_file = allocated_csv
+        if args.allocate_only:
+            print(f"\n{log.summary()}")
+            if events is not None:
+                events.close()
+            return
+
+    # --- Validate the whole inventory before anything is written ---
+    if args.validate or args.validation_report or args.validate_only:
+        with timer.phase("validate"):
+            report = validate_inventory(csv_file, is_flat_vlan, log, validation_profile)
+        log.info(format_validation(report))
+        if args.validation_report:
+            with open(args.validation_report, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            log.info(f"📝 Validation report written to {args.validation_report}")
+        if args.validate_only:
+            print(f"\n{log.summary()}")
+            if events is not None:
+                events.close()
+            sys.exit(0 if report["valid"] else 1)
+
+    manifest = Manifest(args.output_dir, template, args.reserve_count, vlan_profile) if args.incremental else None
+    if args.delta:
+        sink = DeltaSink(args.delta, template_set.templates if template_set is not None
+                         else {None: (template, is_flat_vlan, vlan_profile)})
+    elif args.zip:
+        sink = ZipSink(args.zip)
+    else:
+        sink = DirectorySink(args.output_dir)
+
+    shard_manifest = None
+    if args.shard:
+        output = (("delta", args.delta) if args.delta else ("zip", args.zip) if args.zip
+                  else ("directory", args.output_dir))
+        manifest_path = (os.path.join(args.output_dir, SHARD_MANIFEST_FILE) if output[0] == "directory"
+                         else f"{output[1]}.shard.json")
+        shard_manifest = ShardManifest(manifest_path, args.shard, csv_file, output, template_type, template,
+                                       args.reserve_count, vlan_profile)
+        log.info(f"🧩 Shard {args.shard[0]}/{args.shard[1]}")
+
+    stores = None
+    if args.store or args.store_list:
+        stores = list(args.store or [])
+        if args.store_list:
+            with open(args.store_list, "r", encoding="utf-8") as f:
+                stores += [line.strip() for line in f if line.strip()]
+
+    options = dict(reserve_count=args.reserve_count, workers=args.workers, chunk_size=args.chunk_size,
+                   manifest=manifest, log=log, timer=timer, delta=bool(args.delta), shard=args.shard, stores=stores)
+    if template_set is not None:
+        configs = generate_mixed(template_set, csv_file, mapping=mapping, **options)
+    else:
+        configs = generate(template, csv_file, template_type=template_type, vlan_profile=vlan_profile, **options)
+
+    # --- Process each store in CSV, rendering and writing one row at a time ---
+    with sink:
+        for filename, config in configs:
+            with timer.phase("write"):
+                output_path = sink.write(filename, config)
+            if manifest is not None:
+                manifest.mark_written(filename)
+            if shard_manifest is not None:
+                shard_manifest.record(filename, config)
+
+            log.info(f"✅ Saved: {output_path}")
+    if args.delta:
+        log.info(f"📦 Delta archive: {args.delta} ({sink.count} store(s), {os.path.getsize(args.delta):,} bytes)")
+
+    if manifest is not None:
+        log.info(f"\n⏭️  Skipped {manifest.skipped} unchanged store(s)")
+        for filename in manifest.orphans():
+            orphan_path = os.path.join(args.output_dir, filename)
+            if args.prune:
+                if os.path.exists(orphan_path):
+                    os.remove(orphan_path)
+                log.info(f"🗑️  Pruned orphaned output: {orphan_path}")
+            else:
+                manifest.keep(filename)
+                log.info(f"⚠️  Orphaned output (store no longer in CSV): {orphan_path}")
+        manifest.save()
+
+    if shard_manifest is not None:
+        shard_manifest.save(log)
+        log.info(f"🧩 Shard {args.shard[0]}/{args.shard[1]}: {len(shard_manifest.stores)} store(s), "
+                 f"manifest written to {shard_manifest.path}")
+
+    print(f"\n{log.summary()}")
+    if template_set is not None:
+        print(template_set.format_stats())
+    print(f"🎉 All {template_type} configurations generated successfully!")
+    if events is not None:
+        events.close()
+
+    if args.timing:
+        print(f"\n{timer.format_report()}")
+    if args.timing_json:
+        with open(args.timing_json, "w", encoding="utf-8") as f:
+            json.dump(timer.report(), f, indent=2)
 
-        print(f"✅ Saved: {output_path}")
 
-print(f"\n🎉 All {template_type} configurations generated successfully!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""Benchmark and equivalence harness for generate_teldat_configs.
+
+Synthesizes FlatVlan / InterVlan templates and site CSVs of any size (comma,
+tab or multi-space delimited), runs them through generate() and reports
+rows/sec, per-row latency percentiles and peak RSS as JSON. Every case is
+also checked byte-for-byte against the reference regex renderer (and
+optionally against a folder of previously generated configs).
+
+    python teldat_bench.py --rows 1000 20000 --workers 1 4 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import zip_longest
+from multiprocessing import get_context
+
+import generate_teldat_configs as generator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DELIMITERS = {"comma": ",", "tab": "\t", "whitespace": "    "}
+FLAT_VLAN_MASKS = ["255.255.255.192", "255.255.255.128", "255.255.255.0", "255.255.254.0",
+                   "255.255.252.0", "255.255.240.0", "255.255.0.0"]
+REGIONS = ["North", "South", "East", "West"]
+STORE_FILENAME_PATTERN = re.compile(r"Store_\d{6}_TELDAT_CONFIG\.txt")  # Anything else: the CSV was misparsed
+
+
+# --- Synthetic templates ---
+def make_template(template_type, padding_lines=0):
+    """Return a Teldat template of the given type.
+
+    `padding_lines` adds unrelated config lines to scale the template size.
+    """
+    lines = [
+        "log-command-errors",
+        "no configuration",
+        "set hostname TEMPLATE_HOST",
+        "set inactivity-timer 600",
+        ";",
+    ]
+    for tnip, ip in (("tnip1", "11.11.0.1"), ("tnip2", "11.12.0.1")):
+        lines += [
+            f"network {tnip}",
+            "; -- Tunnel interface configuration --",
+            f"   description \"DMVPN {tnip.upper()}\"",
+            f"   ip address {ip} 255.255.0.0",
+            "   ip mtu 1400",
+            "exit",
+            ";",
+        ]
+
+    if template_type == "FlatVlan":
+        lans = [("lan", "", "10.0.0.1", "255.255.255.192")]
+    else:
+        lans = [(f"vlan{vlan}", f".{vlan}", f"10.0.{i}.1", mask)
+                for i, (vlan, mask) in enumerate(generator.VLAN_MASK_MAP.items())]
+
+    for _, suffix, ip, mask in lans:
+        lines += [f"network bvi0{suffix}", f"   ip address {ip} {mask}", "exit", ";"]
+
+    lines += ["feature dhcp", "; -- DHCP Configuration --", "   server"]
+    for name, _, ip, mask in lans:
+        network = ip.rsplit(".", 1)[0] + ".0"
+        lines += [
+            f"      subnet {name} 1 network {network} {mask}",
+            f"      subnet {name} 1 range {ip.rsplit('.', 1)[0]}.2 {ip.rsplit('.', 1)[0]}.12",
+            f"      subnet {name} 1 router {ip}",
+        ]
+    lines += ["   exit", "exit", ";"]
+
+    lines += [f"   ; padding line {i}: set snmp community public{i} read-only" for i in range(padding_lines)]
+
+    lines += [
+        "vrf wan1",
+        "   route 0.0.0.0 0.0.0.0 tnip1",
+        "exit",
+        "vrf wan2",
+        "   route 0.0.0.0 0.0.0.0 tnip2",
+        "   route 10.10.0.0 255.255.255.0 loopback11",
+        "exit",
+        ";",
+        "dump-command-errors",
+        "end",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# --- Synthetic inventories ---
+def make_rows(template_type, rows, seed=0):
+    """Yield (headers, values) for `rows` synthetic stores."""
+    rng = random.Random(seed)
+    if template_type == "FlatVlan":
+        # More than 5 columns, so the comma / tab variants are detected as such
+        headers = ["StoreName", "Tnip1", "Tnip2", "BVI_IP", "Branch_Mask", "VRF_Branch_IP", "VRF_Branch_Mask", "Region"]
+    else:
+        headers = (["StoreName", "Tnip1", "Tnip2"] + [f"VLAN{vlan}" for vlan in generator.VLAN_MASK_MAP]
+                   + ["VRF_Branch_IP", "VRF_Branch_Mask"])
+    yield headers
+
+    for i in range(rows):
+        a, b = divmod(i, 250)
+        values = [f"Store_{i:06d}", f"11.{11 + a // 250}.{a % 250}.{b + 1}", f"12.{11 + a // 250}.{a % 250}.{b + 1}"]
+        if template_type == "FlatVlan":
+            values += [f"172.{16 + a % 16}.{b}.{rng.randint(1, 60)}", rng.choice(FLAT_VLAN_MASKS),
+                       f"10.{a % 250}.{b}.0", "255.255.255.0", rng.choice(REGIONS)]
+        else:
+            values += [f"{100 + k}.{a % 250}.{b}.{rng.randint(1, 12)}" for k in range(len(generator.VLAN_MASK_MAP))]
+            values += [f"10.{a % 250}.{b}.0", "255.255.255.0"]
+        yield values
+
+
+def write_csv(path, template_type, rows, delimiter, seed=0):
+    separator = DELIMITERS[delimiter]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for values in make_rows(template_type, rows, seed):
+            f.write(separator.join(values) + "\n")
+
+
+def write_fixtures(directory, template_type, rows, delimiter, padding_lines=0, seed=0):
+    """Write a template and CSV named so the generator's auto-detection finds them."""
+    os.makedirs(directory, exist_ok=True)
+    prefix = "FLAT_VLAN" if template_type == "FlatVlan" else "INTER_VLAN"
+    template_path = os.path.join(directory, f"{prefix}_BENCH_TEMPLATE.txt")
+    csv_path = os.path.join(directory, f"{template_type.lower()}_sites.csv")
+    with open(template_path, "w", encoding="utf-8") as f:
+        f.write(make_template(template_type, padding_lines))
+    write_csv(csv_path, template_type, rows, delimiter, seed)
+    return template_path, csv_path
+
+
+# --- Measurements ---
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def reference_configs(template_text, is_flat_vlan, csv_path, reserve_count):
+    """Yield (filename, config) using the full-text regex chain, serially."""
+    reference = generator.CompiledTemplate(template_text, is_flat_vlan, use_regex=True)
+    for row in generator.iter_csv_rows(csv_path, log=lambda message: None):
+        safe_hostname, config = generator.render_store(reference, row, lambda message: None, reserve_count)
+        yield generator.config_filename(safe_hostname), config
+
+
+def verify_case(template_text, template_type, csv_path, workers, reserve_count, compare_dir=None):
+    """Compare generate() output with the reference renderer (and compare_dir).
+
+    Both sides must produce the same number of configs, and every hostname
+    must be a synthetic Store_NNNNNN name.
+    """
+    quiet = generator.GenerationLog(generator.LOG_QUIET, write=lambda message: None)
+    optimized = generator.generate(template_text, csv_path, template_type=template_type,
+                                   reserve_count=reserve_count, workers=workers, log=quiet)
+    reference = reference_configs(template_text, template_type == "FlatVlan", csv_path, reserve_count)
+
+    checked = 0
+    mismatches = []
+    for (filename, config), (ref_filename, ref_config) in zip_longest(optimized, reference, fillvalue=(None, None)):
+        checked += 1
+        if filename is None or ref_filename is None:
+            mismatches.append(f"{filename or ref_filename} (only in {'reference' if filename is None else 'generate()'})")
+        elif not STORE_FILENAME_PATTERN.fullmatch(filename):
+            mismatches.append(f"{filename} (unexpected hostname)")
+        elif filename != ref_filename or config != ref_config:
+            mismatches.append(filename)
+        elif compare_dir:
+            with open(os.path.join(compare_dir, filename), "r", encoding="utf-8") as f:
+                if f.read() != config:
+                    mismatches.append(filename)
+    return {"checked": checked, "mismatches": len(mismatches), "first_mismatches": mismatches[:10]}
+
+
+def run_case(case):
+    """Run one benchmark case (in a fresh process, so peak RSS is per case).
+
+    Per-row latency is only reported for serial runs: with workers, results
+    arrive in chunks and the gaps between them say nothing about a row.
+    """
+    with open(case["template_path"], "r", encoding="utf-8") as f:
+        template_text = f.read()
+
+    quiet = generator.GenerationLog(generator.LOG_QUIET, write=lambda message: None)
+    sink = generator.ZipSink() if case["sink"] == "zip" else None
+    latencies = []
+
+    start = last = time.perf_counter()
+    configs = generator.generate(template_text, case["csv_path"], template_type=case["template_type"],
+                                 reserve_count=case["reserve_count"], workers=case["workers"], log=quiet)
+    if sink is not None:
+        sink.__enter__()
+    for filename, config in configs:
+        if sink is not None:
+            sink.write(filename, config)
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    if sink is not None:
+        sink.__exit__(None, None, None)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        "stores": len(latencies),
+        "seconds": round(elapsed, 4),
+        "rows_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": ({name: round(percentile(latencies, q) * 1000, 4) if latencies else None
+                        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))}
+                       if case["workers"] == 1 else None),
+        "peak_rss_mb": peak_rss_mb(),
+        "warnings": quiet.warnings,
+        "errors": quiet.errors,
+    }
+    if case["verify"]:
+        result["equivalence"] = verify_case(template_text, case["template_type"], case["csv_path"],
+                                            case["workers"], case["reserve_count"], case.get("compare_dir"))
+    return result
+
+
+# --- Command line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Teldat config generator on synthetic inventories.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Inventory sizes (default: 1000 10000)")
+    parser.add_argument("--types", nargs="+", default=list(generator.TEMPLATE_TYPES),
+                        choices=generator.TEMPLATE_TYPES, help="Template types (default: both)")
+    parser.add_argument("--delimiters", nargs="+", default=["comma"], choices=sorted(DELIMITERS),
+                        help="CSV delimiter variants (default: comma)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="Worker counts (default: 1)")
+    parser.add_argument("--padding-lines", type=int, default=200,
+                        help="Extra template lines, to model real template sizes (default: 200)")
+    parser.add_argument("--reserve-count", type=int, default=generator.DEFAULT_RESERVE_COUNT)
+    parser.add_argument("--sink", choices=["none", "zip"], default="none",
+                        help="Also write the configs into an in-memory ZIP (default: none)")
+    parser.add_argument("--no-verify", dest="verify", action="store_false",
+                        help="Skip the byte-for-byte equivalence check")
+    parser.add_argument("--compare-dir", help="Also compare every config with the file of the same name in this folder")
+    parser.add_argument("--write-fixtures", metavar="DIR",
+                        help="Only write the synthetic template and CSV (first type/size/delimiter) to DIR")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results to this file (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    if args.write_fixtures:
+        paths = write_fixtures(args.write_fixtures, args.types[0], args.rows[0], args.delimiters[0],
+                               args.padding_lines, args.seed)
+        print(f"✅ Wrote {paths[0]} and {paths[1]}")
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="teldat_bench_") as workdir:
+        for template_type in args.types:
+            for rows in args.rows:
+                for delimiter in args.delimiters:
+                    case_dir = os.path.join(workdir, f"{template_type}_{rows}_{delimiter}")
+                    template_path, csv_path = write_fixtures(case_dir, template_type, rows, delimiter,
+                                                             args.padding_lines, args.seed)
+                    for workers in args.workers:
+                        case = {
+                            "template_type": template_type, "rows": rows, "delimiter": delimiter,
+                            "workers": workers, "sink": args.sink, "reserve_count": args.reserve_count,
+                            "template_path": template_path, "csv_path": csv_path,
+                            "verify": args.verify, "compare_dir": args.compare_dir,
+                        }
+                        # A fresh process per case keeps peak RSS and caches independent
+                        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                            result = executor.submit(run_case, case).result()
+                        name = f"{template_type}/{rows}/{delimiter}/w{workers}"
+                        equivalence = result.get("equivalence")
+                        status = ""
+                        if equivalence is not None:
+                            status = "✅ identical" if not equivalence["mismatches"] else \
+                                f"❌ {equivalence['mismatches']} mismatch(es)"
+                        p99 = f"{result['latency_ms']['p99']} ms" if result["latency_ms"] else "n/a"
+                        print(f"📊 {name}: {result['rows_per_sec']} rows/s, p99 {p99}, "
+                              f"peak RSS {result['peak_rss_mb']} MB {status}", file=sys.stderr)
+                        case_result = {key: case[key] for key in ("template_type", "rows", "delimiter", "workers", "sink")}
+                        case_result.update(result)
+                        results.append(case_result)
+
+    report = {
+        "generator_version": generator.GENERATOR_VERSION,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "padding_lines": args.padding_lines,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if any(r.get("equivalence", {}).get("mismatches") for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
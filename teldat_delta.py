@@ -0,0 +1,70 @@
+"""Read delta archives written by generate_teldat_configs.py --delta.
+
+A delta archive holds each template once plus the substituted values of
+every store, so any store's config can be rebuilt on demand.
+
+    python teldat_delta.py configs.tdelta                    list the stores
+    python teldat_delta.py configs.tdelta --store RS123      print one store's config
+    python teldat_delta.py configs.tdelta --expand           write every config to output_configs/
+    python teldat_delta.py configs.tdelta --expand --zip configs.zip
+"""
+import argparse
+import sys
+from collections import Counter
+
+import generate_teldat_configs as generator
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild Teldat configs from a delta archive.")
+    parser.add_argument("archive", help="Delta archive written with --delta")
+    actions = parser.add_mutually_exclusive_group()
+    actions.add_argument("--store", metavar="NAME", help="Print the config of one store (name or config filename)")
+    actions.add_argument("--expand", action="store_true", help="Write the config of every store")
+    parser.add_argument("--output", metavar="PATH", help="With --store, write the config to PATH instead of stdout")
+    parser.add_argument("--output-dir", default=generator.OUTPUT_DIR,
+                        help=f"With --expand, folder the configs are written to (default: {generator.OUTPUT_DIR})")
+    parser.add_argument("--zip", metavar="PATH", help="With --expand, write the configs into this ZIP archive")
+    args = parser.parse_args(argv)
+    if args.output and not args.store:
+        parser.error("--output needs --store")
+    if args.zip and not args.expand:
+        parser.error("--zip needs --expand")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.stdout.reconfigure(encoding='utf-8')
+    archive = generator.DeltaArchive.load(args.archive)
+
+    if args.store:
+        filename = archive.find(args.store)
+        if filename is None:
+            print(f"❌ Store '{args.store}' is not in {args.archive}", file=sys.stderr)
+            sys.exit(1)
+        config = archive.render(filename)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as out:
+                out.write(config)
+            print(f"✅ Saved: {args.output}")
+        else:
+            sys.stdout.write(config)
+    elif args.expand:
+        sink = generator.ZipSink(args.zip) if args.zip else generator.DirectorySink(args.output_dir)
+        with sink:
+            for filename, config in archive.items():
+                sink.write(filename, config)
+        print(f"✅ Expanded {sink.count} config(s) to {args.zip or args.output_dir}")
+    else:
+        print(f"📦 {args.archive}: {len(archive)} store(s), generator {archive.generator_version}")
+        counts = Counter(archive.template_name(filename) for filename in archive.filenames)
+        for template in archive.templates:
+            print(f"   🧩 {template['name'] or 'template'}: {counts[template['name']]} store(s), "
+                  f"{len(template['defaults'])} slot(s)")
+        for filename in archive.filenames:
+            print(f"   {filename}")
+
+
+if __name__ == "__main__":
+    main()
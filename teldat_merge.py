@@ -0,0 +1,72 @@
+"""Merge the shards of a sharded generate_teldat_configs.py run.
+
+Each shard process writes its configs and a shard manifest:
+
+    python generate_teldat_configs.py --csv sites.csv --shard 1/4 --zip shard1.zip
+    ...
+    python generate_teldat_configs.py --csv sites.csv --shard 4/4 --zip shard4.zip
+
+The merge checks that every shard is present once and that all of them ran
+on the same CSV, generator version, template type, templates, reserve count
+and VLAN profiles, detects hostnames written by more than one shard,
+verifies each config against its recorded hash and assembles one archive:
+
+    python teldat_merge.py shard*.zip.shard.json --zip teldat_configs.zip --report merge.json
+"""
+import argparse
+import json
+import os
+import sys
+
+import generate_teldat_configs as generator
+
+DEFAULT_ZIP = "teldat_configs.zip"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check and merge the shards of a sharded Teldat config run.")
+    parser.add_argument("manifests", nargs="+", metavar="MANIFEST",
+                        help=f"Shard manifests ('<zip or delta>.shard.json' or "
+                             f"'<output-dir>/{generator.SHARD_MANIFEST_FILE}')")
+    outputs = parser.add_mutually_exclusive_group()
+    outputs.add_argument("--zip", metavar="PATH", help=f"Merged ZIP archive (default: {DEFAULT_ZIP})")
+    outputs.add_argument("--output-dir", help="Write the merged configs to this folder instead of a ZIP")
+    parser.add_argument("--report", metavar="PATH", help="Write the merge report as JSON to PATH")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    log = generator.GenerationLog(generator.LOG_SUMMARY)
+    target = args.output_dir or args.zip or DEFAULT_ZIP
+    # The ZIP is built next to the target and only replaces it once the merge succeeds
+    temp_path = None if args.output_dir else f"{target}.tmp"
+    sink = generator.DirectorySink(args.output_dir) if args.output_dir else generator.ZipSink(temp_path)
+    try:
+        report = generator.merge_shards(args.manifests, sink, log)
+    except BaseException:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    log.info(generator.format_merge(report))
+    log.info(f"📊 Shards reported {report['warnings']} warning(s), {report['errors']} error(s)")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        log.info(f"📝 Merge report written to {args.report}")
+    if report["valid"]:
+        if temp_path is not None:
+            os.replace(temp_path, target)
+        print(f"🎉 Merged {report['written']} configuration(s) into {target}")
+    else:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)  # An existing archive at the target is left untouched
+        print(f"❌ Merge failed: {report['problem_count']} problem(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
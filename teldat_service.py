@@ -0,0 +1,284 @@
+"""Local HTTP generation service for generate_teldat_configs.
+
+Keeps every loaded template compiled in memory, so a request only pays for
+rendering its own rows. Standard library only (http.server, one thread per
+connection, HTTP/1.1 keep-alive).
+
+    python teldat_service.py --templates INTER_VLAN_RS123_TEMPLATE.txt FLAT_VLAN_RS123_TEMPLATE.txt
+
+Endpoints:
+    GET  /health                 status, generator version, loaded templates
+    GET  /templates              loaded templates and their types
+    PUT  /templates/<name>       load or replace a template (body: template text,
+                                 optional ?vlan_profile=NAME)
+    POST /render[?template=NAME] render rows, reply with one JSON document
+    POST /batch[?template=NAME]  render rows, stream one JSON line per store
+
+Rows are sent as JSON (one object, a list of objects, or {"rows": [...]})
+or as CSV (Content-Type: text/csv). A row picks its template by the
+`template` query parameter, its "Template" column, or the only template
+loaded.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import generate_teldat_configs as generator
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 256 * 1024 * 1024  # Largest request body accepted
+
+
+class RequestError(Exception):
+    """A client error, answered with `status` and a JSON error message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- Template registry ---
+class TemplateRegistry:
+    """Templates kept loaded and compiled for the lifetime of the service."""
+
+    def __init__(self, reserve_count=generator.DEFAULT_RESERVE_COUNT, vlan_profiles=None):
+        self.reserve_count = reserve_count
+        self.vlan_profiles = vlan_profiles or generator.VlanProfiles()
+        self.template_set = generator.TemplateSet()
+        self._compiled = {}  # name -> CompiledTemplate, outlives compile_template's LRU
+        self._lock = threading.Lock()
+
+    def load(self, name, template_text, log=print, vlan_profile=None):
+        """Load a template with the named VLAN profile (default: its profile from the profiles file)."""
+        try:
+            profile = (self.vlan_profiles.get(vlan_profile) if vlan_profile
+                       else self.vlan_profiles.for_template(name))
+        except KeyError as e:
+            raise RequestError(404, e.args[0])
+        with self._lock:
+            self.template_set.load(name, template_text, log, profile)
+            self._compiled[name] = generator.compile_template(*self.template_set.templates[name])
+
+    def describe(self):
+        return [{"name": name, "type": "FlatVlan" if is_flat_vlan else "InterVlan",
+                 "vlan_profile": None if is_flat_vlan else (vlan_profile or generator.DEFAULT_VLAN_PROFILE).name}
+                for name, (_, is_flat_vlan, vlan_profile) in self.template_set.templates.items()]
+
+    def resolve(self, row, template=None):
+        """Return the template name for a row (see the module docstring)."""
+        reference = template or (row.get(generator.TEMPLATE_COLUMN) or "").strip()
+        if reference:
+            name = self.template_set.resolve(reference)
+            if name is None:
+                raise RequestError(404, f"Unknown template '{reference}'")
+            return name
+        if len(self._compiled) == 1:
+            return next(iter(self._compiled))
+        raise RequestError(400, f"No template given: use ?template=NAME or a '{generator.TEMPLATE_COLUMN}' column")
+
+    def render(self, row, template=None):
+        """Render one row; returns the JSON-ready result."""
+        row = {str(key): "" if value is None else str(value) for key, value in row.items()}
+        name = self.resolve(row, template)
+        lines = []
+        try:
+            safe_hostname, config = generator.render_store(self._compiled[name], row, lines.append,
+                                                           self.reserve_count, verbose=False)
+        except (KeyError, ValueError) as e:
+            raise RequestError(422, str(e.args[0]) if e.args else str(e))
+        return {
+            "store": safe_hostname,
+            "filename": generator.config_filename(safe_hostname),
+            "template": name,
+            "config": config,
+            "warnings": [line.strip() for line in lines if generator.message_severity(line) == "warning"],
+            "errors": [line.strip() for line in lines if generator.message_severity(line) == "error"],
+        }
+
+
+# --- Request parsing ---
+def parse_rows(body, content_type):
+    """Return the list of row dicts sent in a request body."""
+    if content_type.startswith("text/csv"):
+        try:
+            return list(generator.iter_csv_rows(body, lambda message: None))
+        except UnicodeDecodeError as e:
+            raise RequestError(400, f"CSV is not valid UTF-8: {e}")
+        except csv.Error as e:
+            raise RequestError(400, f"Invalid CSV: {e}")
+    try:
+        data = json.loads(body or b"null")
+    except ValueError as e:
+        raise RequestError(400, f"Invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data["rows"] if "rows" in data else [data]
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise RequestError(400, "Expected a row object, a list of row objects or {\"rows\": [...]}")
+    return data
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: clients reuse one connection
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait for ACKs between them
+    server_version = "TeldatService/" + generator.GENERATOR_VERSION
+
+    @property
+    def registry(self):
+        return self.server.registry
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise RequestError(411, "Content-Length required")
+        try:
+            length = int(length)
+        except ValueError:
+            self.close_connection = True  # The body cannot be skipped without a length
+            raise RequestError(400, f"Invalid Content-Length: {length!r}")
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+        return self.rfile.read(length)
+
+    def handle_errors(self, handler):
+        try:
+            handler()
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            # Last resort: keep-alive clients always get an answer
+            self.log_error("Unhandled error: %r", e)
+            self.send_json(500, {"error": f"Internal error: {e}"})
+
+    def do_GET(self):
+        self.handle_errors(self._get)
+
+    def _get(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self.send_json(200, {"status": "ok", "generator_version": generator.GENERATOR_VERSION,
+                                 "templates": len(self.registry.describe())})
+        elif path == "/templates":
+            self.send_json(200, {"templates": self.registry.describe()})
+        else:
+            self.send_json(404, {"error": f"No such endpoint: {path}"})
+
+    def do_PUT(self):
+        self.handle_errors(self._put_template)
+
+    def _put_template(self):
+        body = self.read_body()  # Always consumed, so the connection stays usable
+        url = urlsplit(self.path)
+        path = url.path
+        if not path.startswith("/templates/") or len(path) == len("/templates/"):
+            raise RequestError(404, f"No such endpoint: {path}")
+        name = unquote(path[len("/templates/"):])
+        vlan_profile = parse_qs(url.query).get("vlan_profile", [None])[0]
+        log_lines = []
+        try:
+            template_text = generator.decode_template(body)
+        except UnicodeDecodeError as e:
+            raise RequestError(400, f"Template is not valid UTF-8: {e}")
+        self.registry.load(name, template_text, log_lines.append, vlan_profile)
+        self.send_json(200, {"loaded": name, "log": [line for line in log_lines if line]})
+
+    def do_POST(self):
+        self.handle_errors(self._post)
+
+    def _post(self):
+        body = self.read_body()
+        url = urlsplit(self.path)
+        if url.path not in ("/render", "/batch"):
+            raise RequestError(404, f"No such endpoint: {url.path}")
+        template = parse_qs(url.query).get("template", [None])[0]
+        rows = parse_rows(body, self.headers.get("Content-Type", "application/json"))
+        if url.path == "/render":
+            self.send_json(200, {"configs": [self.registry.render(row, template) for row in rows]})
+        else:
+            self.stream_batch(rows, template)
+
+    def stream_batch(self, rows, template):
+        """Send one JSON line per store as soon as it is rendered (chunked encoding)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for number, row in enumerate(rows, 1):
+            try:
+                result = self.registry.render(row, template)
+            except RequestError as e:
+                result = {"row": number, "error": str(e), "status": e.status}
+            except Exception as e:
+                # Headers are already sent: report it in the stream, not as a 500 response
+                self.log_error("Unhandled error on row %d: %r", number, e)
+                result = {"row": number, "error": f"Internal error: {e}", "status": 500}
+            line = (json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class GenerationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, registry, verbose=False):
+        super().__init__(address, ServiceHandler)
+        self.registry = registry
+        self.verbose = verbose
+
+
+# --- Command line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Teldat config generation over a local HTTP API.")
+    parser.add_argument("--templates", nargs="*", default=[], metavar="FILE",
+                        help="Template files to load at startup (more can be PUT to /templates/<name>)")
+    parser.add_argument("--vlan-profiles", metavar="PATH",
+                        help="JSON file of named VLAN profiles and the profile each template uses")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--reserve-count", type=int, default=generator.DEFAULT_RESERVE_COUNT,
+                        help=f"IPs reserved at the end of each DHCP range (default: {generator.DEFAULT_RESERVE_COUNT})")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    vlan_profiles = generator.VlanProfiles.load(args.vlan_profiles) if args.vlan_profiles else None
+    registry = TemplateRegistry(args.reserve_count, vlan_profiles)
+    for path in args.templates:
+        with open(path, "r", encoding="utf-8") as f:
+            registry.load(os.path.basename(path), f.read())
+
+    server = GenerationServer((args.host, args.port), registry, args.verbose)
+    print(f"🚀 Teldat generation service on http://{args.host}:{server.server_port} "
+          f"({len(registry.describe())} template(s) loaded)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 import streamlit as st
-import subprocess
+import hashlib
 import os
-import io
-import zipfile
-import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import generate_teldat_configs as generator
+
 # -------------------- PAGE CONFIG --------------------
 st.set_page_config(
     page_title="Teldat Config Generator",
@@ -13,6 +16,332 @@ st.set_page_config(
     layout="centered"
 )
 
+# -------------------- JOB EXECUTOR --------------------
+# Jobs from every session share one bounded pool; extra jobs wait in a bounded queue
+MAX_CONCURRENT_JOBS = int(os.environ.get("TELDAT_MAX_JOBS", "4"))
+MAX_QUEUED_JOBS = int(os.environ.get("TELDAT_MAX_QUEUED_JOBS", "32"))
+MAX_PROBLEMS_SHOWN = 200  # Warnings/errors listed in the page; the rest are in the log download
+RESULT_CACHE_MB = int(os.environ.get("TELDAT_RESULT_CACHE_MB", "256"))  # Finished results kept for resubmissions
+PROGRESS_INTERVAL = 0.5  # Seconds between progress refreshes while a job runs
+
+
+class JobQueue:
+    """Bounded executor for generation jobs, shared by all user sessions."""
+
+    def __init__(self, max_jobs, max_queued):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="teldat-job")
+        self._capacity = threading.BoundedSemaphore(max_jobs + max_queued)
+        self._lock = threading.Lock()
+        self._tickets = {}  # Future -> submission number, while the job is queued or running
+        self._submitted = 0
+        self._started = 0  # Jobs start in submission order
+
+    def jobs_ahead(self, future):
+        """Number of jobs that must finish before a queued job starts (0 once it runs)."""
+        with self._lock:
+            ticket = self._tickets.get(future)
+            if ticket is None or ticket < self._started:
+                return 0
+            return ticket - self._started + 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a job; returns a Future, or None when the queue is full."""
+        if not self._capacity.acquire(blocking=False):
+            return None
+        with self._lock:
+            ticket = self._submitted
+            self._submitted += 1
+            future = self._executor.submit(self._run, fn, args, kwargs)
+            self._tickets[future] = ticket
+        future.add_done_callback(self._release)
+        return future
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self._started += 1
+        return fn(*args, **kwargs)
+
+    def _release(self, future):
+        with self._lock:
+            self._tickets.pop(future, None)
+        self._capacity.release()
+
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS)
+
+
+# -------------------- JOB PROGRESS --------------------
+class JobProgress:
+    """Live counters of one job: written by the job thread, read by the page.
+
+    cancel() asks the job to stop after the store it is rendering; the
+    configs generated so far are still returned as a partial ZIP.
+    """
+
+    def __init__(self):
+        self.total = None  # CSV rows, known once the job starts
+        self.done = 0
+        self.warnings = 0
+        self.errors = 0
+        self.started = None
+        self._cancel = threading.Event()
+
+    def start(self, total):
+        self.total = total
+        self.started = time.monotonic()
+
+    def update(self, log):
+        self.done = log.stores
+        self.warnings = log.warnings
+        self.errors = log.errors
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def fraction(self):
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    @property
+    def rate(self):
+        """Stores per second since the job started."""
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Estimated seconds left, or None before the first store."""
+        if not self.rate or self.total is None:
+            return None
+        return max(0, self.total - self.done) / self.rate
+
+
+class RunningJob:
+    """A submitted job kept in st.session_state across page reruns."""
+
+    def __init__(self, future, progress, cache_key):
+        self.future = future
+        self.progress = progress
+        self.cache_key = cache_key
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "–"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+# -------------------- RESULT CACHE --------------------
+class JobResult:
+    """What the page needs from a finished job: the ZIP, the log and its counts."""
+
+    def __init__(self, zip_bytes, config_count, log, log_lines, timing_report, template_stats=None,
+                 cancelled=False):
+        self.zip_bytes = zip_bytes
+        self.config_count = config_count
+        self.warnings = log.warnings
+        self.errors = log.errors
+        self.problems = log.problems
+        self.log_text = "\n".join(log_lines)
+        self.timing_report = timing_report
+        self.template_stats = template_stats  # Per-template counts of a mixed batch
+        self.cancelled = cancelled  # Stopped by the user: the ZIP holds a partial batch
+
+    @property
+    def size(self):
+        return len(self.zip_bytes) + len(self.log_text.encode("utf-8"))
+
+
+def result_cache_key(csv_bytes, csv_filename, templates):
+    """Hash of everything that determines a job's output.
+
+    `templates` is a list of (filename, template bytes). Filenames are
+    included because template type detection looks at them.
+    """
+    digest = hashlib.sha256()
+    parts = [csv_bytes, csv_filename.encode("utf-8")]
+    for template_filename, template_bytes in templates:
+        parts += [template_filename.encode("utf-8"), template_bytes]
+    parts += [generator.GENERATOR_VERSION.encode("utf-8"), str(generator.DEFAULT_RESERVE_COUNT).encode("utf-8")]
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of finished JobResults, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        if result.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key).size
+            self._entries[key] = result
+            self.size += result.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(RESULT_CACHE_MB * 1024 * 1024)
+
+
+def run_generation_job(csv_bytes, csv_filename, templates, progress=None):
+    """Generate every config of one upload entirely in memory.
+
+    `templates` is a list of (filename, template bytes); with more than one,
+    each CSV row picks its template by its "Template" column (mixed batch).
+    Nothing is written to the shared working directory, so concurrent jobs
+    cannot see each other's files. Returns a JobResult: the full verbose log
+    is kept for download, the UI only shows its summary and the timing report.
+    Templates are compiled through generator.compile_template, so a new CSV
+    against an already seen template skips template analysis.
+    `progress` (a JobProgress) is updated after every store and checked for
+    cancellation.
+    """
+    progress = progress or JobProgress()
+    timer = generator.Instrumentation()
+
+    log_lines = []
+    log = generator.GenerationLog(generator.LOG_VERBOSE, write=log_lines.append)
+    template_set = None
+    if len(templates) > 1:
+        template_set = generator.TemplateSet()
+        with timer.phase("detect"):
+            for template_filename, template_bytes in templates:
+                template_set.load(template_filename, generator.decode_template(template_bytes), log.info)
+        log.info(f"✅ Using CSV: {csv_filename}")
+        template_type = template_set.type_names()
+        # Rows without a known template are skipped by the batch, so they are not counted
+        quiet = lambda message: None
+        progress.start(sum(1 for _ in template_set.assign(generator.iter_site_records(csv_bytes, quiet), log=quiet)))
+        configs = generator.generate_mixed(template_set, csv_bytes, log=log, timer=timer)
+    else:
+        template_filename, template_bytes = templates[0]
+        template_text = generator.decode_template(template_bytes)
+        log.info(f"✅ Using template: {template_filename}")
+        log.info(f"✅ Using CSV: {csv_filename}")
+        with timer.phase("detect"):
+            is_flat_vlan, detection_method = generator.detect_template_type(template_filename, csv_filename,
+                                                                            template_text)
+        generator.log_detection(template_filename, csv_filename, is_flat_vlan, detection_method, log)
+        template_type = "FlatVlan" if is_flat_vlan else "InterVlan"
+        progress.start(sum(1 for _ in generator.iter_csv_rows(csv_bytes, lambda message: None)))
+        configs = generator.generate(template_text, csv_bytes, template_type=template_type, log=log, timer=timer)
+
+    # Stream each config straight into the ZIP (spooled to disk for large batches)
+    zip_sink = generator.ZipSink(spool_max_size=generator.ZIP_SPOOL_MAX_SIZE)
+    with zip_sink:
+        for filename, config in configs:
+            with timer.phase("write"):
+                zip_sink.write(filename, config)
+            progress.update(log)
+            if progress.cancelled:
+                configs.close()  # Stop reading and rendering the remaining rows
+                break
+    log_lines.append(f"\n{log.summary()}")
+    template_stats = template_set.format_stats() if template_set is not None else None
+    if template_stats:
+        log_lines.append(template_stats)
+    if progress.cancelled:
+        log_lines.append(f"🛑 Cancelled after {zip_sink.count} of {progress.total} store(s): "
+                         "the ZIP holds only the configs generated so far.")
+    else:
+        log_lines.append(f"🎉 All {template_type} configurations generated successfully!")
+    timing_report = timer.format_report()
+    log_lines.append(f"\n{timing_report}")
+    return JobResult(zip_sink.getvalue(), zip_sink.count, log, log_lines, timing_report, template_stats,
+                     progress.cancelled)
+
+
+def show_progress(progress, status, bar, metrics, jobs_ahead=0):
+    """Redraw the live progress of a running job into its placeholders."""
+    if progress.started is None:
+        if jobs_ahead:
+            status.info(f"🕒 Queued: waiting for {jobs_ahead} other job(s) to finish...")
+        else:
+            status.info("🕒 Queued: starting...")
+        return
+    total = progress.total or 0
+    status.info("🛑 Cancelling..." if progress.cancelled else "⏳ Generating configurations...")
+    bar.progress(progress.fraction, text=f"{progress.done} / {total} stores")
+    with metrics.container():
+        col_rate, col_eta, col_warnings, col_errors = st.columns(4)
+        col_rate.metric("Stores/s", f"{progress.rate:,.0f}")
+        col_eta.metric("ETA", format_seconds(progress.eta))
+        col_warnings.metric("Warnings", progress.warnings)
+        col_errors.metric("Errors", progress.errors)
+
+
+def show_result(result):
+    """Summary, timing and downloads of a finished (or cancelled) job."""
+    # Compact summary; the full log is a download, not rendered in the page
+    if result.cancelled:
+        st.warning(f"🛑 Generation cancelled: the ZIP holds the {result.config_count} config(s) generated so far.")
+    else:
+        st.success("✅ Configs generated successfully!")
+    col_configs, col_warnings, col_errors = st.columns(3)
+    col_configs.metric("Generated Configs", result.config_count)
+    col_warnings.metric("Warnings", result.warnings)
+    col_errors.metric("Errors", result.errors)
+    if result.template_stats:
+        with st.expander("📄 Per-Template Summary", expanded=True):
+            st.code(result.template_stats, language="text")
+    if result.problems:
+        with st.expander(f"⚠️ View Warnings & Errors ({len(result.problems)})"):
+            st.code("\n".join(result.problems[:MAX_PROBLEMS_SHOWN]), language="text")
+            if len(result.problems) > MAX_PROBLEMS_SHOWN:
+                st.caption(f"Showing the first {MAX_PROBLEMS_SHOWN}; download the full log for the rest.")
+    with st.expander("⏱️ Timing Summary"):
+        st.code(result.timing_report, language="text")
+
+    # Dynamic ZIP filename with date
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
+    zip_filename = f"teldat_configs_{timestamp}{'_partial' if result.cancelled else ''}.zip"
+
+    # Download button
+    st.download_button(
+        label="⬇️ Download Partial Configs (ZIP)" if result.cancelled else "⬇️ Download All Configs (ZIP)",
+        data=result.zip_bytes,
+        file_name=zip_filename,
+        mime="application/zip",
+        use_container_width=True
+    )
+
+    st.download_button(
+        label="📋 Download Generation Log",
+        data=result.log_text,
+        file_name=f"teldat_generation_log_{timestamp}.txt",
+        mime="text/plain",
+        use_container_width=True
+    )
+
+
 # -------------------- HEADER WITH CENTERED LOGO --------------------
 st.markdown(
     """
@@ -54,6 +383,10 @@ with st.expander("ℹ️ Template Types & CSV Requirements"):
     
     ### **Common Columns (Both)**
     - `VRF_Branch_IP`, `VRF_Branch_Mask` (optional for InterVlan, not needed for FlatVlan)
+    
+    ### **Mixed Batches (Several Templates)**
+    - Upload all templates at once and add a `Template` column to the CSV
+    - Each row names its template file, e.g. `FLAT_VLAN_M1_TEMPLATE.txt` (the `.txt` is optional)
     """)
 
 # -------------------- FILE UPLOAD SECTION --------------------
@@ -63,101 +396,51 @@ with col1:
     uploaded_csv = st.file_uploader("📄 Upload CSV File", type=["csv"])
     
 with col2:
-    uploaded_template = st.file_uploader("📄 Upload Template File", type=["txt"])
+    uploaded_templates = st.file_uploader("📄 Upload Template File(s)", type=["txt"], accept_multiple_files=True)
 
-if uploaded_template:
+for uploaded_template in uploaded_templates or []:
     template_name = uploaded_template.name.upper()
     if "FLAT_VLAN" in template_name or "FLATVLAN" in template_name:
-        st.info("🔷 **FlatVlan** template detected")
+        st.info(f"🔷 **FlatVlan** template detected: {uploaded_template.name}")
     elif "INTER_VLAN" in template_name or "INTERVLAN" in template_name:
-        st.info("🔶 **InterVlan** template detected")
+        st.info(f"🔶 **InterVlan** template detected: {uploaded_template.name}")
     else:
-        st.warning("⚠️ Template type unclear. Script will auto-detect based on content.")
+        st.warning(f"⚠️ Template type unclear for {uploaded_template.name}. Script will auto-detect based on content.")
+if uploaded_templates and len(uploaded_templates) > 1:
+    st.info(f"🔀 **Mixed batch**: each CSV row picks its template by the `{generator.TEMPLATE_COLUMN}` column "
+            "(template file name, with or without `.txt`).")
 
 # -------------------- GENERATE CONFIGS BUTTON --------------------
 if st.button("🚀 Generate Configs", type="primary"):
-    if uploaded_csv and uploaded_template:
+    if st.session_state.get("job") is not None:
+        st.warning("⚠️ A generation job is already running: wait for it or cancel it first.")
+    elif uploaded_csv and uploaded_templates:
         try:
-            with st.spinner("⏳ Generating configurations..."):
-                # CRITICAL: Clean up old template and CSV files to prevent wrong file detection
-                for f in os.listdir("."):
-                    # Delete old template files
-                    if f.lower().endswith(".txt") and ("template" in f.lower() or "teldat" in f.lower()):
-                        try:
-                            os.remove(f)
-                            print(f"🗑️ Removed old template: {f}")
-                        except:
-                            pass
-                    # Delete old CSV files
-                    elif f.lower().endswith(".csv"):
-                        try:
-                            os.remove(f)
-                            print(f"🗑️ Removed old CSV: {f}")
-                        except:
-                            pass
-                
-                # Save files with their ORIGINAL names to preserve detection logic
-                csv_filename = uploaded_csv.name
-                template_filename = uploaded_template.name
-                
-                # Save CSV
-                with open(csv_filename, "wb") as f:
-                    f.write(uploaded_csv.read())
-                
-                # Save template
-                with open(template_filename, "wb") as f:
-                    f.write(uploaded_template.read())
-
-                # Clean up old outputs
-                if os.path.exists("output_configs"):
-                    shutil.rmtree("output_configs")
-                os.makedirs("output_configs", exist_ok=True)
-
-                # Run your generator script
-                result = subprocess.run(
-                    ["python", "generate_teldat_configs.py"],
-                    capture_output=True,
-                    text=True,
-                    encoding='utf-8'
-                )
+            csv_bytes = uploaded_csv.getvalue()
+            templates = [(uploaded_template.name, uploaded_template.getvalue()) for uploaded_template in uploaded_templates]
+            st.session_state.pop("result", None)
 
-                if result.returncode == 0:
-                    # Display script output
-                    st.success("✅ Configs generated successfully!")
-                    with st.expander("📋 View Generation Log"):
-                        st.code(result.stdout, language="text")
-                    
-                    # Create ZIP of generated files
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-                        for root, _, files in os.walk("output_configs"):
-                            for file in files:
-                                zipf.write(os.path.join(root, file), arcname=file)
-                    zip_buffer.seek(0)
-
-                    # Dynamic ZIP filename with date
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-                    zip_filename = f"teldat_configs_{timestamp}.zip"
-
-                    # Download button
-                    st.download_button(
-                        label="⬇️ Download All Configs (ZIP)",
-                        data=zip_buffer,
-                        file_name=zip_filename,
-                        mime="application/zip",
-                        use_container_width=True
-                    )
-                    
-                    # Show file count
-                    config_files = [f for f in os.listdir("output_configs") if f.endswith(".txt")]
-                    st.metric("Generated Configs", len(config_files))
-                    
+            # An identical submission (same files, generator version and options) reuses the earlier result
+            result_cache = get_result_cache()
+            cache_key = result_cache_key(csv_bytes, uploaded_csv.name, templates)
+            result = result_cache.get(cache_key)
+            if result is not None:
+                st.info("♻️ Same CSV and template as an earlier run: showing the cached result.")
+                st.session_state["result"] = result
+            else:
+                # Each job gets its own copy of the uploads and runs fully in memory
+                progress = JobProgress()
+                future = get_job_queue().submit(
+                    run_generation_job,
+                    csv_bytes,
+                    uploaded_csv.name,
+                    templates,
+                    progress,
+                )
+                if future is None:
+                    st.error("❌ The generator is busy (job queue is full). Please try again in a moment.")
                 else:
-                    st.error("❌ Error while generating configs.")
-                    with st.expander("🔍 View Error Details"):
-                        st.code(result.stderr, language="text")
-                        if result.stdout:
-                            st.code(result.stdout, language="text")
+                    st.session_state["job"] = RunningJob(future, progress, cache_key)
 
         except Exception as e:
             st.error(f"⚠️ Unexpected error: {e}")
@@ -166,6 +449,34 @@ if st.button("🚀 Generate Configs", type="primary"):
     else:
         st.warning("⚠️ Please upload both CSV and template files first.")
 
+# -------------------- LIVE PROGRESS --------------------
+# The job runs in the shared pool; the page polls its progress. Clicking Cancel
+# reruns the page, which stops this loop, flags the job and resumes polling.
+job = st.session_state.get("job")
+if job is not None:
+    cancel_slot = st.empty()
+    if cancel_slot.button("🛑 Cancel Generation", key="cancel_job", use_container_width=True):
+        job.progress.cancel()
+    status, bar, metrics = st.empty(), st.empty(), st.empty()
+    while not job.future.done():
+        show_progress(job.progress, status, bar, metrics, get_job_queue().jobs_ahead(job.future))
+        time.sleep(PROGRESS_INTERVAL)
+    for placeholder in (cancel_slot, status, bar, metrics):
+        placeholder.empty()
+    del st.session_state["job"]
+    try:
+        result = job.future.result()
+        if not result.cancelled:
+            get_result_cache().put(job.cache_key, result)
+        st.session_state["result"] = result
+    except Exception as e:
+        st.error(f"⚠️ Unexpected error: {e}")
+        st.exception(e)
+
+# Kept in the session, so downloading a file (which reruns the page) keeps the summary
+if st.session_state.get("result") is not None:
+    show_result(st.session_state["result"])
+
 # -------------------- SAMPLE CSV TEMPLATES --------------------
 with st.expander("📥 Download Sample CSV Templates"):
     st.markdown("### InterVlan CSV Sample")
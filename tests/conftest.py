@@ -0,0 +1,13 @@
+"""Inventory rows shared by the tests."""
+
+HEADER = "StoreName,Tnip1,Tnip2,VLAN3100,VLAN3137,VLAN3138,VLAN3139,VLAN3140,VLAN3141,VRF_Branch_IP,VRF_Branch_Mask\n"
+ROWS = [
+    "S1,11.11.0.1,11.12.0.1,10.1.0.1,,,,,,,",
+    "S2,11.11.0.2,11.12.0.2,10.2.0.1,,,,,,,",
+    "S1,11.11.0.3,11.12.0.3,10.3.0.1,,,,,,,",  # Same output file as the first row; this one wins
+]
+
+
+def inventory(*rows):
+    """Return the CSV text of HEADER followed by `rows`."""
+    return HEADER + "".join(row + "\n" for row in rows)
@@ -0,0 +1,34 @@
+import csv
+import io
+
+import pytest
+
+import generate_teldat_configs as generator
+
+COLUMNS = ["StoreName", "Tnip1", "Tnip2", "BVI_IP", "Branch_Mask", "VRF_Branch_IP", "VRF_Branch_Mask"]
+ROWS = [
+    ["S1", "11.11.0.1", "11.12.0.1", "10.9.0.1", "255.255.255.0", "10.50.0.0", "255.255.0.0"],
+    ["S2", "11.11.0.2", "11.12.0.2", "", "", "10.51.0.0", "255.255.0.0"],
+    ["S3", "11.11.0.3", "11.12.0.3", "10.9.1.1", "255.255.255.0", "10.52.0.0", "255.255.0.0"],
+]
+
+
+def allocate(csv_bytes):
+    output = io.StringIO()
+    report = generator.allocate_inventory(csv_bytes, ["10.9.0.0/16"], output, is_flat_vlan=True,
+                                          log=lambda message: None)
+    return report, list(csv.reader(io.StringIO(output.getvalue())))
+
+
+def test_comma_inventory_keeps_every_row_and_fills_the_gap():
+    csv_bytes = "".join(",".join(row) + "\n" for row in [COLUMNS] + ROWS).encode("utf-8")
+    report, rows = allocate(csv_bytes)
+    assert report == {"rows": 3, "stores": 1, "allocated": 1, "exhausted": 0}
+    assert [row[0] for row in rows[1:]] == ["S1", "S2", "S3"]
+    assert rows[2][3:5] == ["10.9.2.1", generator.DEFAULT_LAN_MASK]
+
+
+def test_multi_space_inventory_is_refused():
+    csv_bytes = "".join("   ".join(row) + "\n" for row in [COLUMNS] + ROWS).encode("utf-8")
+    with pytest.raises(ValueError, match="multiple-space"):
+        allocate(csv_bytes)
@@ -0,0 +1,21 @@
+import pytest
+
+import generate_teldat_configs as generator
+import teldat_bench
+
+
+@pytest.mark.parametrize("template_type", ["FlatVlan", "InterVlan"])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_compiled_render_matches_the_regex_chain(template_type, newline):
+    template = teldat_bench.make_template(template_type, padding_lines=20).replace("\n", newline)
+    is_flat_vlan = template_type == "FlatVlan"
+    compiled = generator.CompiledTemplate(template, is_flat_vlan)
+    reference = generator.CompiledTemplate(template, is_flat_vlan, use_regex=True)
+    assert compiled.compiled and compiled.structural
+
+    rows = teldat_bench.make_rows(template_type, 50)
+    header = next(rows)
+    for values in rows:
+        row = dict(zip(header, values))
+        quiet = lambda message: None
+        assert generator.render_store(compiled, row, quiet) == generator.render_store(reference, row, quiet)
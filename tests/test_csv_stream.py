@@ -0,0 +1,38 @@
+import io
+
+import pytest
+
+import generate_teldat_configs as generator
+import teldat_bench
+
+
+class PipeStream(io.RawIOBase):
+    """A read-only, non-seekable byte stream, like a pipe or stdin."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+
+@pytest.mark.parametrize("delimiter", ["comma", "whitespace"])
+def test_generate_reads_a_non_seekable_stream(delimiter):
+    separator = teldat_bench.DELIMITERS[delimiter]
+    rows = list(teldat_bench.make_rows("InterVlan", 5))
+    data = ("\n" + "".join(separator.join(values) + "\n" for values in rows)).encode("utf-8")
+    stream = io.BufferedReader(PipeStream(data))
+    assert not stream.seekable()
+
+    template = teldat_bench.make_template("InterVlan")
+    configs = list(generator.generate(template, stream, template_type="InterVlan", log=lambda message: None))
+    assert configs == list(generator.generate(template, data, template_type="InterVlan", log=lambda message: None))
+    assert [filename for filename, _ in configs] == [generator.config_filename(values[0]) for values in rows[1:]]
+
+    # Line numbers count the blank line before the header
+    values = generator.iter_csv_values(io.BufferedReader(PipeStream(data)), lambda message: None)
+    next(values)
+    assert [number for number, _ in values] == [3, 4, 5, 6, 7]
@@ -0,0 +1,21 @@
+import generate_teldat_configs as generator
+import teldat_bench
+from conftest import ROWS, inventory
+
+
+def test_delta_round_trip_matches_a_normal_run(tmp_path):
+    template = teldat_bench.make_template("InterVlan")
+    csv_bytes = inventory(*ROWS).encode("utf-8")
+    quiet = generator.GenerationLog(generator.LOG_QUIET)
+
+    expected = dict(generator.generate(template, csv_bytes, template_type="InterVlan", log=quiet))
+    sink = generator.DeltaSink(str(tmp_path / "run.tdelta"), {None: (template, False, None)})
+    with sink:
+        for filename, config in generator.generate(template, csv_bytes, template_type="InterVlan", log=quiet,
+                                                   delta=True):
+            sink.write(filename, config)
+
+    archive = generator.DeltaArchive.load(str(tmp_path / "run.tdelta"))
+    assert sink.count == len(archive) == 2
+    assert dict(archive.items()) == expected
+    assert "11.11.0.3" in expected[generator.config_filename("S1")]
@@ -0,0 +1,28 @@
+import pytest
+
+import generate_teldat_configs as generator
+import teldat_bench
+from conftest import ROWS, inventory
+
+
+def generate(tmp_path, capsys, workers):
+    generator.main(["--template", str(tmp_path / "INTER_VLAN_TEMPLATE.txt"), "--csv", str(tmp_path / "sites.csv"),
+                    "--output-dir", str(tmp_path / "out"), "--incremental", "--workers", str(workers)])
+    return capsys.readouterr().out
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_incremental_rerun_with_duplicate_store_names(tmp_path, capsys, workers):
+    (tmp_path / "INTER_VLAN_TEMPLATE.txt").write_text(teldat_bench.make_template("InterVlan"), encoding="utf-8")
+    (tmp_path / "sites.csv").write_text(inventory(*ROWS), encoding="utf-8")
+    config = tmp_path / "out" / generator.config_filename("S1")
+
+    for _ in range(3):
+        assert "Duplicate hostname 'S1'" in generate(tmp_path, capsys, workers)
+        assert "11.11.0.3" in config.read_text(encoding="utf-8")
+
+    # Back to a single row: the file is rewritten from it, then skipped as unchanged
+    (tmp_path / "sites.csv").write_text(inventory(ROWS[0]), encoding="utf-8")
+    generate(tmp_path, capsys, workers)
+    assert "11.11.0.1" in config.read_text(encoding="utf-8")
+    assert "Skipped 1 unchanged" in generate(tmp_path, capsys, workers)
@@ -0,0 +1,31 @@
+import pytest
+
+import generate_teldat_configs as generator
+import teldat_bench
+from conftest import ROWS, inventory
+
+# Invalid Tnip1 in S2: an error; the repeated S1: a warning
+LOGGED_ROWS = [ROWS[0], ROWS[1].replace("11.11.0.2", "11.11.0.x"), ROWS[2]]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_quiet_runs_only_build_warnings_and_errors(workers):
+    template = teldat_bench.make_template("InterVlan")
+    csv_bytes = inventory(*LOGGED_ROWS).encode("utf-8")
+    messages = []
+    log = generator.GenerationLog(generator.LOG_QUIET, write=messages.append)
+    configs = list(generator.generate(template, csv_bytes, template_type="InterVlan", log=log, workers=workers))
+
+    assert len(configs) == 3
+    assert (log.stores, log.warnings, log.errors) == (3, 1, 1)
+    assert messages == ["❌ Line 3 (S2): invalid address in Tnip1 '11.11.0.x' - left unchanged",
+                        "   [S1] ⚠️  WARNING: Duplicate hostname 'S1' - S1_TELDAT_CONFIG.txt is overwritten by a later row"]
+
+
+def test_render_store_skips_detail_messages_unless_verbose():
+    compiled = generator.compile_template(teldat_bench.make_template("InterVlan"), False)
+    row = {"StoreName": "S1", "Tnip1": "11.11.0.1", "Tnip2": "11.12.0.1", "VLAN3100": "10.1.0.1"}
+    verbose, quiet = [], []
+    assert (generator.render_store(compiled, row, verbose.append)
+            == generator.render_store(compiled, row, quiet.append, verbose=False))
+    assert verbose and not quiet
@@ -0,0 +1,62 @@
+import zipfile
+
+import pytest
+
+import generate_teldat_configs as generator
+import teldat_bench
+import teldat_merge
+
+
+def run_shard(directory, template_path, csv_path, index, *extra):
+    zip_path = str(directory / f"shard{index}.zip")
+    generator.main(["--template", template_path, "--csv", csv_path, "--shard", f"{index}/2", "--zip", zip_path,
+                    "--quiet", *extra])
+    return zip_path + ".shard.json"
+
+
+def merge(directory, manifests):
+    return generator.merge_shards(manifests, generator.ZipSink(str(directory / "merged.zip")),
+                                  lambda message: None)
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    return teldat_bench.write_fixtures(str(tmp_path), "InterVlan", 20, "comma")
+
+
+def test_matching_shards_merge(tmp_path, capsys, fixtures):
+    manifests = [run_shard(tmp_path, *fixtures, index) for index in (1, 2)]
+    report = merge(tmp_path, manifests)
+    assert report["valid"]
+    assert report["written"] == 20
+
+
+@pytest.mark.parametrize("field", ["templates", "reserve_count"])
+def test_shards_rendered_differently_are_inconsistent(tmp_path, capsys, fixtures, field):
+    template_path, csv_path = fixtures
+    first = run_shard(tmp_path, template_path, csv_path, 1)
+    if field == "templates":
+        with open(template_path, "a", encoding="utf-8") as f:
+            f.write("! changed\n")
+        second = run_shard(tmp_path, template_path, csv_path, 2)
+    else:
+        second = run_shard(tmp_path, template_path, csv_path, 2, "--reserve-count", "5")
+    report = merge(tmp_path, [first, second])
+    assert not report["valid"]
+    assert [entry["field"] for entry in report["inconsistent"]] == [field]
+    assert report["written"] == 0
+
+
+def test_failed_merge_keeps_an_existing_archive(tmp_path, capsys, fixtures):
+    target = tmp_path / "merged.zip"
+    target.write_bytes(b"archive of an earlier run")
+    first = run_shard(tmp_path, *fixtures, 1)
+    with pytest.raises(SystemExit):
+        teldat_merge.main([first, "--zip", str(target)])  # Shard 2/2 is missing
+    assert target.read_bytes() == b"archive of an earlier run"
+    assert not (tmp_path / "merged.zip.tmp").exists()
+
+    second = run_shard(tmp_path, *fixtures, 2)
+    teldat_merge.main([first, second, "--zip", str(target)])
+    with zipfile.ZipFile(target) as archive:
+        assert len(archive.namelist()) == 20
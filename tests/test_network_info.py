@@ -0,0 +1,26 @@
+import ipaddress
+
+import pytest
+
+import generate_teldat_configs as generator
+
+
+def reference(ip, mask, reserve_count):
+    """The original host-list scan."""
+    network = ipaddress.ip_network(f"{ip}/{mask}", strict=False)
+    hosts = list(network.hosts())
+    return str(network.network_address), str(hosts[0]), str(hosts[max(0, len(hosts) - 1 - reserve_count)])
+
+
+@pytest.mark.parametrize("mask", ["255.255.255.0", "255.255.255.252", "255.255.255.254", "255.255.255.255"])
+@pytest.mark.parametrize("reserve_count", [0, 2, 5])
+def test_network_info_matches_the_host_list(mask, reserve_count):
+    for ip in ("10.1.2.1", "10.1.2.2", "10.1.2.3"):
+        expected = reference(ip, mask, reserve_count)
+        assert generator.compute_network_info(ip, mask, reserve_count) == expected
+        assert generator.site_network_info(ip, generator._ipv4_int(ip), mask, reserve_count) == expected
+
+
+def test_point_to_point_and_host_networks_use_every_address():
+    assert generator.compute_network_info("10.1.2.3", "255.255.255.254", 0) == ("10.1.2.2", "10.1.2.2", "10.1.2.3")
+    assert generator.compute_network_info("10.1.2.3", "255.255.255.255") == ("10.1.2.3", "10.1.2.3", "10.1.2.3")
@@ -0,0 +1,30 @@
+import os
+
+import generate_teldat_configs as generator
+from conftest import ROWS, inventory
+
+
+def lookup(csv_path, *stores):
+    messages = []
+    records = list(generator.iter_store_records(csv_path, stores, messages.append))
+    return [(record.store, record.tnip1, record.line) for record in records], messages
+
+
+def test_row_index_finds_stores_and_follows_csv_changes(tmp_path):
+    csv_path = str(tmp_path / "sites.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        f.write(inventory(*ROWS))
+
+    records, messages = lookup(csv_path, "S1", "S9")
+    assert records == [("S1", "11.11.0.1", 2), ("S1", "11.11.0.3", 4)]
+    assert any("not found" in message for message in messages)
+    assert os.path.exists(csv_path + generator.ROW_INDEX_SUFFIX)
+
+    # Reused while the CSV is unchanged, rebuilt once it changes
+    assert not any("Building row index" in message for message in lookup(csv_path, "S2")[1])
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        f.write("S3,11.11.0.4,11.12.0.4,10.4.0.1,,,,,,,\n")
+    os.utime(csv_path, ns=(0, 0))
+    records, messages = lookup(csv_path, "S3")
+    assert records == [("S3", "11.11.0.4", 5)]
+    assert any("Building row index" in message for message in messages)
@@ -0,0 +1,31 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import teldat_service
+from conftest import HEADER
+
+
+@pytest.fixture
+def server():
+    server = teldat_service.GenerationServer(("127.0.0.1", 0), teldat_service.TemplateRegistry())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("body, error", [
+    (HEADER.encode("utf-8") + b"S\xe9,11.11.0.1,11.12.0.1,10.1.0.1,,,,,,,\n", "CSV is not valid UTF-8"),
+    (HEADER.encode("utf-8") + b'"' + b"x" * 200000 + b'",,,,,,,,,,\n', "Invalid CSV"),
+])
+def test_bad_csv_body_is_a_client_error(server, body, error):
+    connection = http.client.HTTPConnection(*server.server_address)
+    connection.request("POST", "/render", body, {"Content-Type": "text/csv"})
+    response = connection.getresponse()
+    assert response.status == 400
+    assert json.loads(response.read())["error"].startswith(error)
+    connection.close()
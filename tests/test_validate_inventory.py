@@ -0,0 +1,25 @@
+import generate_teldat_configs as generator
+from conftest import inventory
+
+
+def validate(*rows):
+    return generator.validate_inventory(inventory(*rows).encode("utf-8"), False, lambda message: None)
+
+
+def test_vrf_summary_route_covers_own_vlans():
+    report = validate("S1,11.11.0.1,11.12.0.1,10.1.0.1,10.1.0.17,,,,,10.1.0.0,255.255.255.0")
+    assert report["valid"]
+
+
+def test_duplicate_vlans_inside_vrf_summary_route_are_reported():
+    report = validate("S1,11.11.0.1,11.12.0.1,10.1.0.1,10.1.0.1,,,,,10.1.0.0,255.255.255.0")
+    assert not report["valid"]
+    [overlap] = report["overlapping_subnets"]
+    assert overlap["duplicate"]
+    assert {overlap["field"], overlap["conflicts_with"]["field"]} == {"VLAN3100", "VLAN3137"}
+
+
+def test_vlan_overlapping_another_stores_vrf_route_is_reported():
+    report = validate("S1,11.11.0.1,11.12.0.1,10.1.0.1,,,,,,10.1.0.0,255.255.255.0",
+                      "S2,11.11.0.2,11.12.0.2,10.2.0.1,,,,,,10.1.0.0,255.255.0.0")
+    assert not report["valid"]
@@ -0,0 +1,33 @@
+import generate_teldat_configs as generator
+
+PROFILE = generator.VlanProfile("prefix", {"10": "255.255.255.0", "100": "255.255.255.0"})
+CSV = (b"StoreName,Tnip1,Tnip2,VLAN10,VLAN100,VRF_Branch_IP,VRF_Branch_Mask\n"
+       b"S1,11.11.0.9,11.12.0.9,172.16.5.1,,,\n")
+
+
+def make_template():
+    # VLAN 100 comes first, so an unanchored "network bvi0.10" would match its block
+    lines = ["set hostname TEMPLATE_HOST", ";"]
+    for tnip, ip in (("tnip1", "11.11.0.1"), ("tnip2", "11.12.0.1")):
+        lines += [f"network {tnip}", f"   ip address {ip} 255.255.0.0", "exit", ";"]
+    for vlan, net in (("100", "10.0.1"), ("10", "10.0.0")):
+        lines += [f"network bvi0.{vlan}", f"   ip address {net}.1 255.255.255.0", "exit", ";"]
+    lines += ["feature dhcp", "   server"]
+    for vlan, net in (("100", "10.0.1"), ("10", "10.0.0")):
+        lines += [f"      subnet vlan{vlan} 1 network {net}.0 255.255.255.0",
+                  f"      subnet vlan{vlan} 1 range {net}.2 {net}.12",
+                  f"      subnet vlan{vlan} 1 router {net}.1"]
+    return "\n".join(lines + ["   exit", "exit", ";", "end"]) + "\n"
+
+
+def test_vlan_that_prefixes_another_only_fills_its_own_block():
+    template = make_template()
+    assert generator.CompiledTemplate(template, False, vlan_profile=PROFILE).structural
+
+    [(_, config)] = generator.generate(template, CSV, template_type="InterVlan", vlan_profile=PROFILE,
+                                       log=lambda message: None)
+    assert "network bvi0.100\n   ip address 10.0.1.1 " in config
+    assert "network bvi0.10\n   ip address 172.16.5.1 " in config
+    reference = generator.CompiledTemplate(template, False, use_regex=True, vlan_profile=PROFILE)
+    [row] = generator.iter_csv_rows(CSV, lambda message: None)
+    assert generator.render_store(reference, row, lambda message: None)[1] == config
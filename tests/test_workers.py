@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+import generate_teldat_configs as generator
+import teldat_bench
+
+
+def run(tmp_path, capsys, template_path, csv_path, name, *options):
+    output_dir = tmp_path / name
+    generator.main(["--template", template_path, "--csv", csv_path, "--output-dir", str(output_dir), *options])
+    files = {filename: (output_dir / filename).read_bytes() for filename in sorted(os.listdir(output_dir))}
+    return files, capsys.readouterr().out.replace(str(output_dir), "<out>")
+
+
+@pytest.mark.parametrize("template_type", ["FlatVlan", "InterVlan"])
+def test_workers_match_a_serial_run(tmp_path, capsys, template_type):
+    template_path, csv_path = teldat_bench.write_fixtures(str(tmp_path), template_type, 40, "comma")
+    # A bad address in a repeated store, so warnings and errors are part of the log order
+    header = next(teldat_bench.make_rows(template_type, 0))
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write(",".join(["Store_000003", "11.11.0.x"] + ["10.0.0.1"] * (len(header) - 2)) + "\n")
+
+    files, log = run(tmp_path, capsys, template_path, csv_path, "serial")
+    assert len(files) == 40
+    assert "invalid address in Tnip1" in log and "Duplicate hostname" in log
+    for workers, chunk_size in ((2, 1), (2, 7), (3, 100)):
+        assert run(tmp_path, capsys, template_path, csv_path, f"w{workers}c{chunk_size}",
+                   "--workers", str(workers), "--chunk-size", str(chunk_size)) == (files, log)
@@ -0,0 +1,18 @@
+import io
+import zipfile
+
+import generate_teldat_configs as generator
+
+
+def test_repeated_filename_keeps_the_later_config(tmp_path):
+    for target in (None, str(tmp_path / "configs.zip")):
+        sink = generator.ZipSink(target)
+        with sink:
+            sink.write("S1.txt", "first")
+            sink.write("S2.txt", "other")
+            sink.write("S1.txt", "second")
+        archive = io.BytesIO(sink.getvalue()) if target is None else target
+        with zipfile.ZipFile(archive) as z:
+            assert z.namelist() == ["S1.txt", "S2.txt"]
+            assert z.read("S1.txt") == b"second"
+        assert sink.count == 2